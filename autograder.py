@@ -1,4 +1,11 @@
+import contextlib
+import io
 import itertools
+import os
+import random
+import tempfile
+import time
+import traceback
 import cspbase
 
 from propagators import *
@@ -38,6 +45,46 @@ def nQueens(n):
         csp.add_constraint(c)
     return csp
 
+##dom/wdeg: a domain wipeout found by prop_FC or prop_GAC adds one to the
+##weight of the constraint it was found on only, ord_dom_wdeg then prefers
+##that constraint's variables, and reset_weights forgets the weights.
+def test_dom_wdeg():
+    score = 0
+    try:
+        details = ""
+        x, y, z, w = [Variable(name, [1, 2]) for name in "XYZW"]
+        csp = CSP("wdeg", [x, y, z, w])
+        c1 = Constraint("C1", [x, y])
+        c1.add_satisfying_tuples([(1, 2), (2, 1)])
+        c2 = Constraint("C2", [z, w])
+        c2.add_satisfying_tuples([(1, 2), (2, 1)])
+        csp.add_constraint(c1)
+        csp.add_constraint(c2)
+        if ord_dom_wdeg(csp) is not x:
+            details = "Failed dom/wdeg test: unweighted tie not broken by variable order"
+        for prop, weight in ((prop_FC, 2), (prop_GAC, 3)):
+            w.prune_value(2)
+            z.assign(1)
+            status, pruned = prop(csp, z)
+            if status or c2.weight != weight or c1.weight != 1:
+                details = "Failed dom/wdeg test: weights {} and {} after a wipeout on C2 with {}".format(
+                    c1.weight, c2.weight, prop.__name__)
+            z.unassign()
+            for var, val in pruned:
+                var.unprune_value(val)
+            w.unprune_value(2)
+        if ord_dom_wdeg(csp) is not z:
+            details = "Failed dom/wdeg test: ord_dom_wdeg ignored the weight of C2"
+        csp.reset_weights()
+        if c2.weight != 1 or ord_dom_wdeg(csp) is not x:
+            details = "Failed dom/wdeg test: reset_weights kept the weight of C2"
+        if not details:
+            score = 1
+    except Exception:
+        details = "One or more runtime errors occurred while testing dom/wdeg: %r" % traceback.format_exc()
+
+    return score,details
+
 def test_ord_mrv():
 
     a = Variable('A', [1])
@@ -258,6 +305,639 @@ def three_queen_FC():
 
     return score,details
 
+def random_board(rng, n):
+    '''Return a random n x n board with at least one solution: a few givens
+       and inequalities taken from a random latin square, with vertical
+       clues as clue rows between the cell rows'''
+    rows, cols, syms = [rng.sample(range(n), n) for i in range(3)]
+    square = [[syms[(rows[r] + cols[c]) % n] + 1 for c in range(n)] for r in range(n)]
+    def clue(a, b):
+        return ("<" if a < b else ">") if rng.random() < 0.25 else "."
+    board = []
+    for r in range(n):
+        if r:
+            board.append([clue(square[r-1][c], square[r][c]) for c in range(n)])
+        row = []
+        for c in range(n):
+            if c:
+                row.append(clue(square[r][c-1], square[r][c]))
+            row.append(square[r][c] if rng.random() < 0.1 else 0)
+        board.append(row)
+    return board
+
+##Vertical clues: a 3x3 board with the top left cell 1 and one vertical clue
+##between the first two rows, given as a clue row of n entries or of 2n-1
+##entries, has the solutions of a brute force search over the 12 latin
+##squares of order 3, in every model. The counts were checked by hand.
+def test_vertical_clues():
+    score = 0
+    try:
+        details = ""
+        squares = [square for square in itertools.product(itertools.permutations(range(1, 4)), repeat=3)
+                   if all(len(set(col)) == 3 for col in zip(*square))]
+        models = (futoshiki_csp_model_1, futoshiki_csp_model_2,
+                  futoshiki_csp_model_1_intensional, futoshiki_csp_model_2_alldiff)
+        for col, clue, count in ((0, '>', 0), (1, '<', 1), (1, '>', 3), (2, '<', 1)):
+            expected = set(sum(square, ()) for square in squares if square[0][0] == 1
+                           and (square[0][col] < square[1][col]) == (clue == '<'))
+            if len(expected) != count:
+                details = "Failed vertical clue test: brute force found {} solutions, expected {}".format(len(expected), count)
+            short = ['.'] * 3
+            short[col] = clue
+            long = ['.'] * 5
+            long[2 * col] = clue
+            for clue_row in (short, long):
+                board = [[1, '.', 0, '.', 0], clue_row, [0, '.', 0, '.', 0], [0, '.', 0, '.', 0]]
+                for model in models:
+                    csp, var_array = model(board)
+                    found = set(BT(csp).iter_solve(prop_GAC, ord_mrv))
+                    if found != expected:
+                        details = "Failed vertical clue test: {} gave {} solutions for clue row {}, expected {}".format(
+                            model.__name__, len(found), clue_row, count)
+        if not details:
+            score = 1
+    except Exception:
+        details = "One or more runtime errors occurred while testing vertical clues: %r" % traceback.format_exc()
+
+    return score,details
+
+##Intensional model 1: check functions instead of tables give the solution
+##counts of the table model 1, with forward checking and with GAC.
+def test_model_intensional():
+    score = 0
+    try:
+        rng = random.Random(0)
+        details = ""
+        boards = [random_board(rng, 4 if trial < 9 else 5) for trial in range(12)]
+        boards.append([[0, '.', 0, '.', 0, '.', 0] for i in range(4)])
+        for board in boards:
+            for prop in (prop_FC, prop_GAC):
+                counts = [count_solutions(model(board)[0], prop, ord_mrv)
+                          for model in (futoshiki_csp_model_1, futoshiki_csp_model_1_intensional)]
+                if counts[0] != counts[1]:
+                    details = "Failed intensional model test: model 1 has {} solutions, {} with check functions ({})".format(
+                        counts[0], counts[1], prop.__name__)
+        if not details:
+            score = 1
+    except Exception:
+        details = "One or more runtime errors occurred while testing the intensional model: %r" % traceback.format_exc()
+
+    return score,details
+
+##AllDifferent (Regin's filtering, warm started matching): find_unsupported
+##gives exactly the values brute force GAC removes, and model 2 with
+##AllDifferent constraints has the same solutions as with tables.
+def test_all_different():
+    score = 0
+    try:
+        rng = random.Random(0)
+        details = ""
+        for trial in range(100):
+            n = rng.randint(2, 5)
+            vars = [Variable("V{}".format(i), rng.sample(range(6), rng.randint(1, 5))) for i in range(n)]
+            c = AllDifferentConstraint("A", vars)
+            for state in range(4):  #several states per constraint, for the warm start
+                for var in vars:
+                    if var.is_assigned():
+                        var.unassign()
+                    var.restore_curdom()
+                    for val in var.domain():
+                        if rng.random() < 0.2:
+                            var.prune_value(val)
+                for var in vars:
+                    if rng.random() < 0.3 and var.cur_domain_size():
+                        var.assign(rng.choice(var.cur_domain()))
+                subset = None
+                if rng.random() < 0.5:
+                    subset = rng.sample(vars, rng.randint(1, n))
+                supported = set()
+                for t in itertools.product(*[var.cur_domain() for var in vars]):
+                    if len(set(t)) == n:
+                        supported.update(zip(vars, t))
+                expected = set((var, val) for var in vars if not var.is_assigned()
+                               and (subset is None or var in subset)
+                               for val in var.cur_domain() if not (var, val) in supported)
+                if set(c.find_unsupported(subset)) != expected:
+                    details = "Failed AllDifferent test: find_unsupported does not match brute force GAC"
+                    break
+            if details:
+                break
+        for trial in range(12):
+            board = random_board(rng, 4 if trial < 9 else 5)
+            counts = [count_solutions(model(board)[0], prop_GAC, ord_mrv)
+                      for model in (futoshiki_csp_model_2, futoshiki_csp_model_2_alldiff)]
+            if counts[0] != counts[1]:
+                details = "Failed AllDifferent test: model 2 has {} solutions, {} with AllDifferent".format(*counts)
+                break
+        if not details:
+            score = 1
+    except Exception:
+        details = "One or more runtime errors occurred while testing AllDifferent: %r" % traceback.format_exc()
+
+    return score,details
+
+##Board generation: generated boards have a unique solution (checked with
+##model 1, not the model the generator uses), and removing any one of their
+##clues (a given value or an inequality) leaves several solutions.
+def test_generate_board():
+    score = 0
+    try:
+        from futoshiki_generator import generate_board, has_unique_solution
+        details = ""
+        for n, seed, vertical in ((4, 0, False), (5, 1, False), (5, 2, True)):
+            board = generate_board(n, seed, vertical)
+            if not has_unique_solution(board, futoshiki_csp_model_1, prop_GAC):
+                details = "Failed board generation test: {}x{} board of seed {} has no unique solution".format(n, n, seed)
+                break
+            for r, row in enumerate(board):
+                for c, entry in enumerate(row):
+                    if entry in ('<', '>') or (type(entry) is int and entry != 0):
+                        reduced = [list(other) for other in board]
+                        reduced[r][c] = 0 if type(entry) is int else '.'
+                        if has_unique_solution(reduced, futoshiki_csp_model_1, prop_GAC):
+                            details = "Failed board generation test: clue at [{}][{}] of the {}x{} board of seed {} is not needed".format(
+                                r, c, n, n, seed)
+        if not details:
+            score = 1
+    except Exception:
+        details = "One or more runtime errors occurred while testing board generation: %r" % traceback.format_exc()
+
+    return score,details
+
+##Compact-Table on random tables: the solution count matches brute force and
+##the bitset of valid tuples is right at every node of the search.
+def random_tables(rng, table_class):
+    '''Return (csp, tables, number of solutions) for a csp of 5 variables
+       and 4 random table constraints of class table_class'''
+    vars = [Variable("V{}".format(i), list(range(rng.randint(2, 4)))) for i in range(5)]
+    csp = CSP("random tables", vars)
+    tables = []
+    for k in range(4):
+        scope = rng.sample(vars, rng.randint(2, 3))
+        c = table_class("T{}".format(k), scope)
+        c.add_satisfying_tuples([t for t in itertools.product(*[var.domain() for var in scope])
+                                 if rng.random() < 0.6])
+        csp.add_constraint(c)
+        tables.append(c)
+    expected = 0
+    for t in itertools.product(*[var.domain() for var in vars]):
+        value = dict(zip(vars, t))
+        if all(c.check([value[var] for var in c.scope]) for c in tables):
+            expected += 1
+    return csp, tables, expected
+
+def test_compact_table():
+    score = 0
+    try:
+        rng = random.Random(0)
+        details = ""
+        for trial in range(30):
+            csp, tables, expected = random_tables(rng, CompactTableConstraint)
+
+            stale = []
+            def checked_GAC(csp, newVar=None):
+                for c in tables:
+                    if c.current != c._valid_tuples():
+                        stale.append(c)
+                return prop_GAC(csp, newVar)
+
+            found = count_solutions(csp, checked_GAC, ord_mrv)
+            if stale or any(c.current != c._valid_tuples() for c in tables):
+                details = "Failed Compact-Table test: stale bitset of valid tuples"
+                break
+            if found != expected:
+                details = "Failed Compact-Table test: found {} solutions, expected {}".format(found, expected)
+                break
+        if not details:
+            score = 1
+    except Exception:
+        details = "One or more runtime errors occurred while testing Compact-Table: %r" % traceback.format_exc()
+
+    return score,details
+
+##Array tables: find_unsupported (on the whole scope or a vars subset) in
+##random partial states removes exactly the values in no valid tuple,
+##and search with GAC on array tables finds all the solutions, also once a
+##domain has grown.
+def test_array_table():
+    if cspbase.numpy is None:
+        return 1, "Skipped array table test: numpy is not installed"
+    score = 0
+    try:
+        rng = random.Random(0)
+        details = ""
+        for trial in range(30):
+            csp, tables, expected = random_tables(rng, ArrayTableConstraint)
+            vars = csp.get_all_vars()
+            for state in range(5):
+                for var in vars:
+                    if var.is_assigned():
+                        var.unassign()
+                    var.restore_curdom()
+                    for val in var.domain():
+                        if rng.random() < 0.2:
+                            var.prune_value(val)
+                for var in vars:
+                    if rng.random() < 0.3 and var.cur_domain_size():
+                        var.assign(rng.choice(var.cur_domain()))
+                for c in tables:
+                    subset = None
+                    if rng.random() < 0.5:
+                        subset = rng.sample(c.get_scope(), rng.randint(1, len(c.get_scope())))
+                    supported = set()
+                    for t in itertools.product(*[var.cur_domain() for var in c.get_scope()]):
+                        if c.check(list(t)):
+                            supported.update(zip(c.get_scope(), t))
+                    unsupported = set((var, val) for var in c.get_scope() if not var.is_assigned()
+                                      and (subset is None or var in subset)
+                                      for val in var.cur_domain() if not (var, val) in supported)
+                    if set(c.find_unsupported(subset)) != unsupported:
+                        details = "Failed array table test: find_unsupported does not match brute force GAC"
+                        break
+                if details:
+                    break
+            if details:
+                break
+            for var in vars:
+                if var.is_assigned():
+                    var.unassign()
+                var.restore_curdom()
+            found = count_solutions(csp, prop_GAC, ord_mrv)
+            if found != expected:
+                details = "Failed array table test: found {} solutions, expected {}".format(found, expected)
+                break
+        a = Variable("A", [1])
+        b = Variable("B", [1])
+        c = ArrayTableConstraint("T", [a, b])
+        c.add_satisfying_tuples([(1, 1), (2, 1), (1, 2)])
+        csp = CSP("grown domain", [a, b])
+        csp.add_constraint(c)
+        count_solutions(csp, prop_GAC, ord_mrv)
+        a.add_domain_values([2])
+        found = count_solutions(csp, prop_GAC, ord_mrv)
+        if found != 2:
+            details = "Failed array table test: found {} solutions after add_domain_values, expected 2".format(found)
+        if not details:
+            score = 1
+    except Exception:
+        details = "One or more runtime errors occurred while testing array tables: %r" % traceback.format_exc()
+
+    return score,details
+
+def recount_errors(counts):
+    '''Return the (c, var, val) whose support count differs from a count
+       made from scratch from the supports of c's relation'''
+    errors = []
+    for c in counts.tracked:
+        for i, var in enumerate(c.get_scope()):
+            for val in var.domain():
+                n = 0
+                for t in c.relation.supports.get((i, val), ()):
+                    if all(other.in_cur_domain(t[j]) for j, other in enumerate(c.get_scope()) if j != i):
+                        n += 1
+                if counts.get(c, var, val) != n:
+                    errors.append((c, var, val))
+    return errors
+
+##Support counts: at every node of a search using val_lcv the incrementally
+##maintained counts equal counts made from scratch, also after constraints
+##are removed from the CSP and added back.
+def test_support_counts():
+    score = 0
+    try:
+        rng = random.Random(0)
+        details = ""
+        for trial in range(6):
+            model = futoshiki_csp_model_1 if trial % 2 == 0 else futoshiki_csp_model_2
+            csp, var_array = model(random_board(rng, 4))
+            wrong = []
+            def checked_GAC(csp, newVar=None):
+                if csp.support_counts is not None:
+                    wrong.extend(recount_errors(csp.support_counts))
+                return prop_GAC(csp, newVar)
+
+            def count(limit=None):
+                return sum(1 for _ in BT(csp).iter_solve(checked_GAC, ord_mrv, val_lcv, limit))
+
+            expected = count()
+            removed = rng.sample(csp.get_all_cons(), 3)
+            for c in removed:
+                csp.remove_constraint(c)
+            wrong.extend(recount_errors(csp.get_support_counts()))
+            count(50)
+            for c in removed:
+                csp.add_constraint(c)
+            wrong.extend(recount_errors(csp.get_support_counts()))
+            found = count()
+            if wrong:
+                details = "Failed support count test: {} wrong counts in a {} search".format(len(wrong), model.__name__)
+                break
+            if found != expected:
+                details = "Failed support count test: found {} solutions after adding back removed constraints, expected {}".format(found, expected)
+                break
+        if not details:
+            score = 1
+    except Exception:
+        details = "One or more runtime errors occurred while testing support counts: %r" % traceback.format_exc()
+
+    return score,details
+
+def restored(csp):
+    '''True if every variable of csp is unassigned with its whole domain'''
+    return all(not var.is_assigned() and var.cur_domain() == var.domain() for var in csp.get_all_vars())
+
+##Solution enumeration: count_solutions stops at limit, iter_solve yields
+##distinct valid solutions, and every variable is unassigned with its whole
+##domain once the generator is exhausted, stopped by limit or closed early.
+def test_iter_solve():
+    score = 0
+    try:
+        details = ""
+        empty = [[0, '.', 0, '.', 0, '.', 0] for i in range(4)]
+        cases = [(nQueens(3), 0), (nQueens(6), 4), (nQueens(8), 92),
+                 (futoshiki_csp_model_1(empty)[0], 576)]
+        for csp, expected in cases:
+            for prop in (prop_FC, prop_GAC):
+                for limit in (0, 1, 2, None):
+                    found = count_solutions(csp, prop, ord_mrv, limit)
+                    wanted = expected if limit is None else min(limit, expected)
+                    if found != wanted:
+                        details = "Failed solution enumeration test: {} counted {} solutions with limit {}, expected {}".format(
+                            csp.name, found, limit, wanted)
+                    if not restored(csp):
+                        details = "Failed solution enumeration test: {} not restored after counting with limit {}".format(csp.name, limit)
+                solutions = set()
+                for solution in BT(csp).iter_solve(prop, ord_mrv):
+                    value = dict(zip(csp.get_all_vars(), solution))
+                    if not all(c.check([value[var] for var in c.get_scope()]) for c in csp.get_all_cons()):
+                        details = "Failed solution enumeration test: {} yielded an invalid solution".format(csp.name)
+                    solutions.add(solution)
+                if len(solutions) != expected:
+                    details = "Failed solution enumeration test: {} yielded {} distinct solutions, expected {}".format(
+                        csp.name, len(solutions), expected)
+                if expected:
+                    search = BT(csp).iter_solve(prop, ord_mrv)
+                    for k in range((expected + 1) // 2):
+                        next(search)
+                    search.close()
+                    if not restored(csp):
+                        details = "Failed solution enumeration test: {} not restored after closing iter_solve".format(csp.name)
+        if not details:
+            score = 1
+    except Exception:
+        details = "One or more runtime errors occurred while testing solution enumeration: %r" % traceback.format_exc()
+
+    return score,details
+
+def solved(csp):
+    '''True if every constraint of csp holds on the current assignment'''
+    return all(c.check([var.get_assigned_value() for var in c.get_scope()]) for c in csp.get_all_cons())
+
+##Restarts: the Luby sequence, a complete search once max_restarts is used
+##up (3-queens is proven unsatisfiable), and valid solutions with both
+##schedules on n-queens and the benchmark corpus.
+def test_restarts():
+    score = 0
+    try:
+        import benchmark
+        details = ""
+        if [luby(i) for i in range(1, 16)] != [1, 1, 2, 1, 1, 2, 4, 1, 1, 2, 1, 1, 2, 4, 8]:
+            details = "Failed restart test: wrong Luby sequence"
+        solver = BT(nQueens(3))
+        status = solver.restart_solve(prop_FC, ord_mrv, schedule=luby_schedule(1), max_restarts=5, seed=0)
+        if status != False or solver.nRestarts != 5:
+            details = "Failed restart test: 3-queens gave {} after {} restarts, expected False after 5".format(
+                status, solver.nRestarts)
+        problems = [(nQueens(n), prop_FC, ord_mrv, 1) for n in (6, 8, 12)]
+        for entry in benchmark.load_corpus():
+            problems.append((futoshiki_csp_model_2_alldiff(entry["board"])[0], prop_GAC, ord_dom_wdeg, 64))
+        for csp, prop, var_ord, unit in problems:
+            for schedule in (luby_schedule(unit), None):
+                solver = BT(csp)
+                if solver.restart_solve(prop, var_ord, schedule=schedule, seed=0) != True or not solved(csp):
+                    details = "Failed restart test: no valid solution found for {}".format(csp.name)
+                solver.restore_all_variable_domains()
+        if not details:
+            score = 1
+    except Exception:
+        details = "One or more runtime errors occurred while testing restarts: %r" % traceback.format_exc()
+
+    return score,details
+
+##Search results: bt_search reports SOLVED with the solution in the
+##assignment, UNSATISFIABLE, LIMIT_REACHED when stopped by decision_limit
+##and NOT_RUN without a propagator, printing nothing unless verbose.
+def test_search_result():
+    score = 0
+    try:
+        details = ""
+        unsat = [[0, '<', 0], [0, '<', 0]]  #both rows 1 2, so the columns repeat
+        out = io.StringIO()
+        with contextlib.redirect_stdout(out):
+            csp, var_array = futoshiki_csp_model_1(random_board(random.Random(0), 4))
+            result = BT(csp).bt_search(prop_GAC, ord_mrv)
+            if result.status != SOLVED or not result.solved or not solved(csp):
+                details = "Failed search result test: status {} for a satisfiable board".format(result.status)
+            elif (set(result.assignment) != set(csp.get_all_vars())
+                  or result.grid(var_array) != [[var.get_assigned_value() for var in row] for row in var_array]):
+                details = "Failed search result test: assignment of a SOLVED result is not the solution"
+            for csp in (futoshiki_csp_model_1(unsat)[0], nQueens(3)):
+                result = BT(csp).bt_search(prop_FC, ord_mrv)
+                if result.status != UNSATISFIABLE or result.solved or result.assignment:
+                    details = "Failed search result test: status {} for unsatisfiable {}".format(result.status, csp.name)
+            solver = BT(nQueens(8))
+            solver.decision_limit = 1
+            result = solver.bt_search(prop_FC, ord_mrv)
+            if result.status != LIMIT_REACHED or result.decisions != 1 or result.assignment:
+                details = "Failed search result test: status {} after {} decisions with decision_limit=1".format(
+                    result.status, result.decisions)
+            result = BT(nQueens(4)).bt_search(None)
+            if result.status != NOT_RUN or result.assignment:
+                details = "Failed search result test: status {} without a propagator".format(result.status)
+        if out.getvalue():
+            details = "Failed search result test: bt_search printed {!r} with verbose=False".format(out.getvalue())
+        if not details:
+            score = 1
+    except Exception:
+        details = "One or more runtime errors occurred while testing search results: %r" % traceback.format_exc()
+
+    return score,details
+
+##Batch solving: solve_many returns one result per board in input order,
+##in process and over a pool, with the solution of solve_board and None for
+##an unsatisfiable board; a board that cannot be modelled raises in the
+##caller, and iter_solve_many in process reads no board ahead.
+def test_solve_many():
+    score = 0
+    try:
+        import futoshiki_batch
+        rng = random.Random(0)
+        details = ""
+        boards = [random_board(rng, rng.randint(3, 5)) for i in range(8)]
+        boards.insert(3, [[0, '<', 0], [0, '<', 0]])
+        expected = [futoshiki_batch.solution_grid(futoshiki_batch.solve_board(board)[0]) for board in boards]
+        if expected[3] is not None or None in expected[:3] + expected[4:]:
+            details = "Failed batch test: solve_board got the satisfiable boards wrong"
+        for workers, chunksize in ((0, None), (2, 1), (2, 3)):
+            results = futoshiki_batch.solve_many(boards, workers=workers, chunksize=chunksize)
+            if [r.index for r in results] != list(range(len(boards))):
+                details = "Failed batch test: results not in input order with {} workers".format(workers)
+            elif [r.solution for r in results] != expected or results[3].is_solved():
+                details = "Failed batch test: wrong solutions with {} workers".format(workers)
+            try:
+                futoshiki_batch.solve_many(boards[:2] + [[[0, '.', 0], [0]]], workers=workers, chunksize=chunksize)
+                details = "Failed batch test: a malformed board raised nothing with {} workers".format(workers)
+            except IndexError:
+                pass
+        read = []
+        def reading(boards):
+            for board in boards:
+                read.append(board)
+                yield board
+        stream = futoshiki_batch.iter_solve_many(reading(boards), workers=0)
+        first = next(stream)
+        stream.close()
+        if len(read) != 1 or first.index != 0 or first.solution != expected[0]:
+            details = "Failed batch test: iter_solve_many read {} boards before yielding the first result".format(len(read))
+        if not details:
+            score = 1
+    except Exception:
+        details = "One or more runtime errors occurred while testing batch solving: %r" % traceback.format_exc()
+
+    return score,details
+
+def slow_model(board):
+    '''model 1, built after sleeping long enough to lose any race'''
+    time.sleep(30)
+    return futoshiki_csp_model_1(board)
+
+def failing_model(board):
+    raise ValueError("failing model")
+
+##Portfolio: the first configuration to answer wins over a slower and a
+##failing one, for a solvable and an unsatisfiable board, with the stats of
+##its search; the win is recorded, survives saving and loading, and with
+##one worker makes the winner the configuration run.
+def test_portfolio():
+    score = 0
+    try:
+        import futoshiki_batch
+        import futoshiki_portfolio
+        details = ""
+        board = random_board(random.Random(0), 5)
+        unsat = [[0, '<', 0], [0, '<', 0]]
+        configs = [("slow", slow_model, prop_GAC, ord_mrv, None),
+                   ("failing", failing_model, prop_GAC, ord_mrv, None),
+                   ("fast", futoshiki_csp_model_1, prop_GAC, ord_mrv, None)]
+        stats = futoshiki_portfolio.PortfolioStats()
+        for b in (board, unsat):
+            flat, decisions, prunings, cpu_time = futoshiki_batch.solve_board(b)
+            result = futoshiki_portfolio.solve_portfolio(b, configs, workers=3, timeout=20, stats=stats)
+            if result.winner != "fast" or result.solution != futoshiki_batch.solution_grid(flat):
+                details = "Failed portfolio test: {!r} answered first with {}".format(result.winner, result.solution)
+            elif result.decisions != decisions or result.prunings != prunings or result.wall_time >= 20:
+                details = "Failed portfolio test: wrong stats for the winner: {}".format(result)
+        path = os.path.join(tempfile.mkdtemp(), "portfolio.json")
+        stats.save(path)
+        stats = futoshiki_portfolio.load_stats(path)
+        if stats.wins != {"fast": 2}:
+            details = "Failed portfolio test: recorded wins {}".format(stats.wins)
+        result = futoshiki_portfolio.solve_portfolio(board, configs, workers=1, timeout=20, stats=stats)
+        if result.winner != "fast":
+            details = "Failed portfolio test: with one worker {!r} was run instead of the ranked winner".format(result.winner)
+        if not details:
+            score = 1
+    except Exception:
+        details = "One or more runtime errors occurred while testing portfolio solving: %r" % traceback.format_exc()
+
+    return score,details
+
+def frontier_count(csp, propagator, var_ord, decision_limit=None, fail_limit=None):
+    '''Count the solutions of csp by searching with the given decision or
+       fail limit and searching the frontier of each stopped search again'''
+    solver = BT(csp)
+    found = 0
+    paths = [[]]
+    while paths:
+        path = paths.pop()
+        if solver.start_search(propagator) != True:
+            continue
+        consistent = True
+        for var, val in path:
+            if not var.in_cur_domain(val):
+                consistent = False
+                break
+            var.assign(val)
+            del solver.unasgn_vars[var]
+            if not solver.propagate(propagator, var):
+                consistent = False
+                break
+        if not consistent:
+            continue
+        solver.decision_limit = decision_limit
+        solver.fail_limit = fail_limit
+        found += sum(1 for _ in solver.bt_solutions(propagator, var_ord, None))
+        if solver.limit_reached:
+            paths.extend(path + rest for rest in solver.frontier())
+    return found
+
+##BT.frontier covers exactly the unexplored part of the tree: counting by
+##splitting searches at a decision or fail limit gives the full count, in process
+##and in parallel_solve.
+def test_frontier():
+    score = 0
+    try:
+        import futoshiki_parallel
+        details = ""
+        for n, prop in ((6, prop_FC), (8, prop_FC), (8, prop_GAC)):
+            expected = count_solutions(nQueens(n), prop, ord_mrv)
+            for limit in (1, 3, 10):
+                for found in (frontier_count(nQueens(n), prop, ord_mrv, decision_limit=limit),
+                              frontier_count(nQueens(n), prop, ord_mrv, fail_limit=limit)):
+                    if found != expected:
+                        details = "Failed frontier test: {}-queens counted {} solutions, expected {}".format(n, found, expected)
+        empty = [[0, '.', 0, '.', 0, '.', 0] for i in range(4)]
+        for workers in (0, 2):
+            result = futoshiki_parallel.parallel_solve(empty, workers=workers, split_after=20, count=True)
+            if result.count != 576:
+                details = "Failed frontier test: parallel_solve counted {} 4x4 Latin squares, expected 576".format(result.count)
+        if not details:
+            score = 1
+    except Exception:
+        details = "One or more runtime errors occurred while testing BT.frontier: %r" % traceback.format_exc()
+
+    return score,details
+
+##Profiling: with GAC on tables, check functions and global constraints,
+##every constraint revised by propagation counts its support calls and the
+##tuples (or bound tests and matching edges) it looked at.
+def test_profiling():
+    score = 0
+    try:
+        rng = random.Random(0)
+        details = ""
+        board = random_board(rng, 5)
+        models = [futoshiki_csp_model_1, futoshiki_csp_model_1_intensional, futoshiki_csp_model_2_alldiff,
+                  lambda board: futoshiki_csp_model_2(board, CompactTableConstraint)]
+        for model in models:
+            csp, var_array = model(board)
+            profiler = csp.enable_profiling()
+            count_solutions(csp, prop_GAC, ord_mrv)
+            revised = [(c, stats) for c, stats in profiler.constraint_stats() if stats.revisions]
+            if not revised:
+                details = "Failed profiling test: no constraint of {} was revised".format(csp.name)
+            for c, stats in revised:
+                if not stats.support_calls or not (stats.tuples or isinstance(c, CompactTableConstraint)):
+                    details = "Failed profiling test: {} of {} revised {} times with supports={} tuples={}".format(
+                        c.name, csp.name, stats.revisions, stats.support_calls, stats.tuples)
+                    break
+        if not details:
+            score = 1
+    except Exception:
+        details = "One or more runtime errors occurred while testing profiling: %r" % traceback.format_exc()
+
+    return score,details
+
 if __name__ == "__main__":
 
  
@@ -299,4 +979,97 @@ if __name__ == "__main__":
 
     print("Total score on GAC/FC tests: %d/4\n" % total)
 
+    total = 0
+    print("Model Test: test_vertical_clues")
+    score,details = test_vertical_clues()
+    total += score
+    print(details)
+    print("=======================================================")
+
+    print("Model Test: test_model_intensional")
+    score,details = test_model_intensional()
+    total += score
+    print(details)
+    print("=======================================================")
+
+    print("AllDifferent Test: test_all_different")
+    score,details = test_all_different()
+    total += score
+    print(details)
+    print("=======================================================")
+
+    print("Table Test: test_compact_table")
+    score,details = test_compact_table()
+    total += score
+    print(details)
+    print("=======================================================")
+
+    print("Table Test: test_array_table")
+    score,details = test_array_table()
+    total += score
+    print(details)
+    print("=======================================================")
+
+    print("Heuristic Test: test_dom_wdeg")
+    score,details = test_dom_wdeg()
+    total += score
+    print(details)
+    print("=======================================================")
+
+    print("Heuristic Test: test_support_counts")
+    score,details = test_support_counts()
+    total += score
+    print(details)
+    print("=======================================================")
+
+    print("Search Test: test_iter_solve")
+    score,details = test_iter_solve()
+    total += score
+    print(details)
+    print("=======================================================")
+
+    print("Search Test: test_restarts")
+    score,details = test_restarts()
+    total += score
+    print(details)
+    print("=======================================================")
+
+    print("Generator Test: test_generate_board")
+    score,details = test_generate_board()
+    total += score
+    print(details)
+    print("=======================================================")
+
+    print("Search Test: test_search_result")
+    score,details = test_search_result()
+    total += score
+    print(details)
+    print("=======================================================")
+
+    print("Batch Test: test_solve_many")
+    score,details = test_solve_many()
+    total += score
+    print(details)
+    print("=======================================================")
+
+    print("Portfolio Test: test_portfolio")
+    score,details = test_portfolio()
+    total += score
+    print(details)
+    print("=======================================================")
+
+    print("Search Test: test_frontier")
+    score,details = test_frontier()
+    total += score
+    print(details)
+    print("=======================================================")
+
+    print("Profiling Test: test_profiling")
+    score,details = test_profiling()
+    total += score
+    print(details)
+    print("=======================================================")
+
+    print("Total score on table/search tests: %d/15\n" % total)
+
 
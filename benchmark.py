@@ -0,0 +1,273 @@
+'''Benchmark of the Futoshiki models, propagators and heuristics.
+
+   Runs every model x propagator x heuristic combination over a corpus of
+   boards from 4x4 to 9x9 (benchmark_corpus.json; each size has easy,
+   medium and hard boards, see make_corpus) and every propagator x
+   heuristic combination over n-queens (autograder.nQueens), and writes
+   the results as JSON, one record per run:
+
+      board, size, tier        which problem was solved
+      model, propagator, heuristic
+      build_time               seconds of wall time to build the CSP
+      wall_time, cpu_time      seconds spent in the search (BT.solve)
+      decisions, prunings      BT statistics of the search
+      peak_memory              peak bytes allocated while building and
+                               solving (tracemalloc; a separate run, so
+                               tracing does not slow down the timed one)
+      solved                   True/False (None if the search could not run
+                               or ran out of budget)
+      out_of_budget            True if the search was stopped after
+                               --budget decisions
+
+   Combinations that are far too slow on large boards (e.g. the n-ary
+   table model beyond 6x6, or plain backtracking beyond 5x5 and on the
+   models with n-ary row and column constraints) are skipped
+   unless --all is given; see MAX_SIZE.
+
+   Usage:
+      python benchmark.py [-o results.json] [--sizes 4 5 6] [--models model_1]
+                          [--propagators prop_GAC] [--heuristics mrv]
+                          [--budget 20000] [--no-queens] [--no-memory] [--all]
+      python benchmark.py --make-corpus
+'''
+import argparse
+import functools
+import json
+import os
+import platform
+import random
+import sys
+import time
+import tracemalloc
+
+from cspbase import *
+from propagators import *
+from futoshiki_csp import *
+import autograder
+
+
+CORPUS_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "benchmark_corpus.json")
+
+MODELS = [("model_1", futoshiki_csp_model_1),
+          ("model_2", futoshiki_csp_model_2),
+          ("model_1_intensional", futoshiki_csp_model_1_intensional),
+          ("model_2_alldiff", futoshiki_csp_model_2_alldiff)]
+MODELS.append(("model_2_ct", functools.partial(futoshiki_csp_model_2, table_class=CompactTableConstraint)))
+if numpy is not None:
+    MODELS.append(("model_2_array", functools.partial(futoshiki_csp_model_2, table_class=ArrayTableConstraint)))
+
+PROPAGATORS = [("prop_BT", prop_BT),
+               ("prop_FC", prop_FC),
+               ("prop_GAC", prop_GAC)]
+
+# (name, var_ord, val_ord)
+HEURISTICS = [("static", None, None),
+              ("mrv", ord_mrv, None),
+              ("mrv_degree", ord_mrv_degree, None),
+              ("dom_wdeg", ord_dom_wdeg, None),
+              ("mrv_lcv", ord_mrv, val_lcv)]
+
+QUEENS_SIZES = [4, 6, 8, 10, 12]
+
+# Largest board size run by default for a (model, propagator, heuristic)
+# combination; None in a key matches anything. The first matching entry
+# applies.
+MAX_SIZE = [(("model_2", "prop_BT", None), 0),  # n-ary constraints are only checked
+            (("model_2_array", "prop_BT", None), 0),  # once fully assigned
+            (("model_2_ct", "prop_BT", None), 0),
+            (("model_2_alldiff", "prop_BT", None), 0),
+            (("model_2", None, None), 6),  # tables of up to n! tuples per row
+            (("model_2_array", None, "mrv_lcv"), 5),  # support counts over large tables
+            (("model_2_ct", None, "mrv_lcv"), 5),
+            (("model_2_array", None, None), 8),
+            (("model_2_ct", None, None), 8),
+            ((None, "prop_BT", None), 5),
+            ((None, "prop_FC", "static"), 6),
+            ((None, "prop_FC", "mrv_lcv"), 7),
+            ((None, "prop_GAC", "static"), 7)]
+
+# Fraction of the cells left empty by the generator that are filled in
+# again for each tier of difficulty (hard boards are minimal puzzles).
+TIERS = [("easy", 0.4), ("medium", 0.2), ("hard", 0.0)]
+
+
+def make_corpus(sizes=range(4, 10), per_tier=2, seed=0, workers=None):
+    '''Return the list of corpus entries (dicts with keys name, size, tier
+       and board). For each size per_tier minimal puzzles are generated
+       (futoshiki_generator) and each gives one board per tier.'''
+    import futoshiki_generator
+    entries = []
+    for size in sizes:
+        seeds = [seed + 1000 * size + i for i in range(per_tier)]
+        boards = futoshiki_generator.generate_many(per_tier, size, seeds[0], workers=workers)
+        for i, board in enumerate(boards):
+            solution = _solve_board(board)
+            empty = [(r, c) for r in range(size) for c in range(size) if board[r][2 * c] == 0]
+            rng = random.Random(seeds[i])
+            rng.shuffle(empty)
+            for tier, fill in TIERS:
+                tier_board = [list(row) for row in board]
+                for r, c in empty[:int(fill * len(empty))]:
+                    tier_board[r][2 * c] = solution[r][c]
+                entries.append({"name": "{0}x{0}-{1}-{2}".format(size, tier, i + 1),
+                                "size": size, "tier": tier, "board": tier_board})
+    return entries
+
+
+def _solve_board(board):
+    csp, var_array = futoshiki_csp_model_2_alldiff(board)
+    BT(csp).solve(prop_GAC, ord_mrv)
+    return [[var.get_assigned_value() for var in row] for row in var_array]
+
+
+def load_corpus(path=CORPUS_FILE):
+    with open(path) as f:
+        return json.load(f)
+
+
+def save_corpus(entries, path=CORPUS_FILE):
+    with open(path, "w") as f:
+        f.write("[\n")
+        f.write(",\n".join(json.dumps(entry) for entry in entries))
+        f.write("\n]\n")
+
+
+def skipped(model, propagator, heuristic, size):
+    '''True if the combination is not run by default at this size'''
+    for key, max_size in MAX_SIZE:
+        if all(k is None or k == name for k, name in zip(key, (model, propagator, heuristic))):
+            return size > max_size
+    return False
+
+
+class OutOfBudget(Exception):
+    '''Raised to stop a search that has used up its decisions'''
+
+
+def with_budget(propagator, budget):
+    '''Return propagator wrapped to raise OutOfBudget when called more
+       than budget+1 times (once per decision, plus once before search)'''
+    calls = [0]
+
+    def limited(csp, newVar=None):
+        calls[0] += 1
+        if calls[0] > budget + 1:
+            raise OutOfBudget()
+        return propagator(csp, newVar)
+    return limited
+
+
+def run(build, propagator, var_ord, val_ord, memory=True, budget=None):
+    '''Build a CSP with build() and solve it, giving up after budget
+       decisions if budget is not None. Returns the dict of measurements
+       (see the module docstring).'''
+    limited = lambda: propagator if budget is None else with_budget(propagator, budget)
+    wall = time.perf_counter()
+    csp = build()
+    build_time = time.perf_counter() - wall
+
+    solver = BT(csp)
+    wall, cpu = time.perf_counter(), time.process_time()
+    try:
+        solved = solver.solve(limited(), var_ord, val_ord)
+        out_of_budget = False
+    except OutOfBudget:
+        solved = None
+        out_of_budget = True
+    wall_time, cpu_time = time.perf_counter() - wall, time.process_time() - cpu
+    result = {"build_time": build_time, "wall_time": wall_time, "cpu_time": cpu_time,
+              "decisions": solver.nDecisions, "prunings": solver.nPrunings,
+              "peak_memory": None, "solved": solved, "out_of_budget": out_of_budget}
+
+    if memory and not out_of_budget:
+        tracemalloc.start()
+        BT(build()).solve(limited(), var_ord, val_ord)
+        result["peak_memory"] = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+    return result
+
+
+def benchmark(corpus, models=MODELS, propagators=PROPAGATORS, heuristics=HEURISTICS,
+              queens_sizes=QUEENS_SIZES, memory=True, run_all=False, budget=None, log=None):
+    '''Run the benchmark and return the list of result records. Each
+       record is also written to log (a file object) as it completes.'''
+    results = []
+
+    def record(entry, name, size, tier, model):
+        entry.update(board=name, size=size, tier=tier, model=model,
+                     propagator=prop_name, heuristic=heur_name)
+        results.append(entry)
+        if log:
+            print("{board:16} {model:20} {propagator:8} {heuristic:10} "
+                  "{cpu_time:8.3f}s {decisions:8} decisions".format(**entry), file=log, flush=True)
+
+    for item in corpus:
+        for model_name, model in models:
+            for prop_name, propagator in propagators:
+                for heur_name, var_ord, val_ord in heuristics:
+                    if not run_all and skipped(model_name, prop_name, heur_name, item["size"]):
+                        continue
+                    build = lambda: model(item["board"])[0]
+                    record(run(build, propagator, var_ord, val_ord, memory, budget),
+                           item["name"], item["size"], item["tier"], model_name)
+    for n in queens_sizes:
+        for prop_name, propagator in propagators:
+            for heur_name, var_ord, val_ord in heuristics:
+                if not run_all and skipped("nqueens", prop_name, heur_name, n):
+                    continue
+                build = lambda: autograder.nQueens(n)
+                record(run(build, propagator, var_ord, val_ord, memory, budget),
+                       "{}-queens".format(n), n, None, "nqueens")
+    return results
+
+
+def _select(options, names):
+    if not names:
+        return options
+    unknown = set(names) - set(option[0] for option in options)
+    if unknown:
+        sys.exit("unknown: " + ", ".join(sorted(unknown)))
+    return [option for option in options if option[0] in names]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the Futoshiki CSP solvers.")
+    parser.add_argument("-o", "--output", help="write the JSON results here (default: stdout)")
+    parser.add_argument("--corpus", default=CORPUS_FILE, help="corpus of boards (JSON)")
+    parser.add_argument("--sizes", type=int, nargs="+", help="board sizes to run")
+    parser.add_argument("--tiers", nargs="+", help="difficulty tiers to run")
+    parser.add_argument("--models", nargs="+")
+    parser.add_argument("--propagators", nargs="+")
+    parser.add_argument("--heuristics", nargs="+")
+    parser.add_argument("--budget", type=int, default=20000,
+                        help="give up a search after this many decisions (0: no limit)")
+    parser.add_argument("--no-queens", action="store_true", help="skip n-queens")
+    parser.add_argument("--no-memory", action="store_true", help="skip the peak memory runs")
+    parser.add_argument("--all", action="store_true", help="also run the combinations skipped by default")
+    parser.add_argument("--make-corpus", action="store_true", help="generate the corpus file and exit")
+    args = parser.parse_args(argv)
+
+    if args.make_corpus:
+        save_corpus(make_corpus(), args.corpus)
+        return
+
+    corpus = [item for item in load_corpus(args.corpus)
+              if (not args.sizes or item["size"] in args.sizes)
+              and (not args.tiers or item["tier"] in args.tiers)]
+    queens_sizes = [] if args.no_queens else [n for n in QUEENS_SIZES if not args.sizes or n in args.sizes]
+    results = benchmark(corpus, _select(MODELS, args.models), _select(PROPAGATORS, args.propagators),
+                        _select(HEURISTICS, args.heuristics), queens_sizes,
+                        not args.no_memory, args.all, args.budget or None, sys.stderr)
+    report = {"python": platform.python_version(),
+              "platform": platform.platform(),
+              "time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+              "results": results}
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=1)
+    else:
+        json.dump(report, sys.stdout, indent=1)
+
+
+if __name__ == "__main__":
+    main()
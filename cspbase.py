@@ -1,5 +1,15 @@
 import time
 import functools
+import heapq
+import itertools
+import operator
+import random
+import weakref
+
+try:
+    import numpy
+except ImportError:     #only needed by ArrayTableConstraint
+    numpy = None
 
 '''Constraint Satisfaction Routines
    A) class Variable
@@ -28,7 +38,16 @@ import functools
       Once initialized the constraint can be incrementally initialized
       with a list of satisfying tuples. Each tuple specifies a value
       for each variable in the constraint (in the same ORDER as the
-      variables of the constraint were specified).
+      variables of the constraint were specified). The tuples are held
+      in a Relation, shared by all constraints with the same tuples.
+
+      Subclasses (FunctionConstraint, NotEqualConstraint,
+      LessThanConstraint, GreaterThanConstraint, AllDifferentConstraint)
+      instead define the constraint by a check function and never
+      store any tuples. ArrayTableConstraint (needs numpy) keeps its
+      tuples as an array and filters them with vectorised operations,
+      and CompactTableConstraint keeps the set of still valid tuples
+      as a bitset updated as domains change.
 
     C) Backtracking routine---takes propagator and CSP as arguments
        so that basic backtracking, forward-checking or GAC can be 
@@ -36,6 +55,13 @@ import functools
 
 '''
 
+def _less(a, b):
+    '''a < b, treating incomparable values as unordered'''
+    try:
+        return a < b
+    except TypeError:
+        return False
+
 class Variable: 
 
     '''Class for defining CSP variables.  On initialization the
@@ -45,11 +71,12 @@ class Variable:
 
        The variable object offers two types of functionality to support
        search. 
-       (a) It has a current domain, implimented as a set of flags 
+       (a) It has a current domain, implimented as a bitmask of flags 
            determining which domain values are "current", i.e., unpruned.
            - you can prune a value, and restore it.
            - you can obtain a list of values in the current domain, or count
              how many are still there
+           - you can snapshot the whole current domain and load it back
 
        (b) You can assign and unassign a value to the variable.
            The assigned value must be from the variable domain, and
@@ -81,16 +108,46 @@ class Variable:
         '''
         self.name = name                #text name for variable
         self.dom = list(domain)         #Make a copy of passed domain
-        self.curdom = [True] * len(domain)      #using list
+        #map from domain value to its (first) index in dom
+        self.dom_index = dict()
+        #dom_sorted is True while dom is strictly increasing, which lets
+        #cur_min/cur_max read the bounds straight off the bitmask
+        self.dom_sorted = True
+        for i, val in enumerate(self.dom):
+            self.dom_index.setdefault(val, i)
+            if i > 0:
+                self.dom_sorted = self.dom_sorted and _less(self.dom[i-1], val)
+        #current domain as a bitmask: bit i is set iff dom[i] is unpruned.
+        #curdom_size caches the number of set bits so that sizing the
+        #current domain never has to scan it.
+        self.curdom = (1 << len(self.dom)) - 1
+        self.curdom_size = len(self.dom)
         #for bt_search
         self.assignedValue = None
+        #(constraint, position) for every constraint with this variable
+        #in its scope, so assign/unassign can keep their counts of
+        #unassigned variables up to date
+        self.scopes = []
+        #objects told about every change of the current domain as seen
+        #from outside (assignments included), see add_observer, and
+        #those of them that are passed the values that changed
+        self.observers = []
+        self.value_observers = []
 
     def add_domain_values(self, values):
         '''Add additional domain values to the domain
            Removals not supported removals'''
+        added = 0
         for val in values: 
+            if self.dom:
+                self.dom_sorted = self.dom_sorted and _less(self.dom[-1], val)
+            self.dom_index.setdefault(val, len(self.dom))
+            added |= 1 << len(self.dom)
+            self.curdom |= 1 << len(self.dom)
+            self.curdom_size += 1
             self.dom.append(val)
-            self.curdom.append(True)
+        if self.observers and not self.is_assigned():
+            self._notify(0, added)
 
     def domain_size(self):
         '''Return the size of the (permanent) domain'''
@@ -106,46 +163,95 @@ class Variable:
 
     def prune_value(self, value):
         '''Remove value from CURRENT domain'''
-        self.curdom[self.value_index(value)] = False
+        bit = 1 << self.value_index(value)
+        if self.curdom & bit:
+            self.curdom ^= bit
+            self.curdom_size -= 1
+            if self.observers and not self.is_assigned():
+                self._notify(bit, 0)
 
     def unprune_value(self, value):
         '''Restore value to CURRENT domain'''
-        self.curdom[self.value_index(value)] = True
+        bit = 1 << self.value_index(value)
+        if not self.curdom & bit:
+            self.curdom |= bit
+            self.curdom_size += 1
+            if self.observers and not self.is_assigned():
+                self._notify(0, bit)
 
     def cur_domain(self):
         '''return list of values in CURRENT domain (if assigned 
            only assigned value is viewed as being in current domain)'''
-        vals = []
         if self.is_assigned():
-            vals.append(self.get_assigned_value())
-        else:
-            for i, val in enumerate(self.dom):
-                if self.curdom[i]:
-                    vals.append(val)
+            return [self.get_assigned_value()]
+        dom = self.dom
+        vals = []
+        mask = self.curdom
+        while mask:
+            low = mask & -mask          #lowest set bit
+            vals.append(dom[low.bit_length() - 1])
+            mask ^= low
         return vals
 
     def in_cur_domain(self, value):
         '''check if value is in CURRENT domain (without constructing list)
            if assigned only assigned value is viewed as being in current 
            domain'''
-        if not value in self.dom:
+        i = self.dom_index.get(value)
+        if i is None:
             return False
         if self.is_assigned():
             return value == self.get_assigned_value()
         else:
-            return self.curdom[self.value_index(value)]
+            return bool(self.curdom >> i & 1)
 
     def cur_domain_size(self):
         '''Return the size of the variables domain (without construcing list)'''
         if self.is_assigned():
             return 1
         else:
-            return(sum(1 for v in self.curdom if v))
+            return self.curdom_size
+
+    def cur_min(self):
+        '''Return the smallest value in the CURRENT domain (None if it
+           is empty). O(1) when the domain values are sorted'''
+        if self.is_assigned():
+            return self.get_assigned_value()
+        if not self.curdom:
+            return None
+        if self.dom_sorted:
+            return self.dom[(self.curdom & -self.curdom).bit_length() - 1]
+        return min(self.cur_domain())
+
+    def cur_max(self):
+        '''Return the largest value in the CURRENT domain (None if it
+           is empty). O(1) when the domain values are sorted'''
+        if self.is_assigned():
+            return self.get_assigned_value()
+        if not self.curdom:
+            return None
+        if self.dom_sorted:
+            return self.dom[self.curdom.bit_length() - 1]
+        return max(self.cur_domain())
 
     def restore_curdom(self):
         '''return all values back into CURRENT domain'''
-        for i in range(len(self.curdom)):
-            self.curdom[i] = True
+        self.load_curdom((1 << len(self.dom)) - 1)
+
+    def save_curdom(self):
+        '''Return a snapshot of the CURRENT domain. The snapshot is a
+           plain int and can be handed back to load_curdom'''
+        return self.curdom
+
+    def load_curdom(self, snapshot):
+        '''Set the CURRENT domain back to a snapshot obtained from
+           save_curdom (in one operation)'''
+        if snapshot != self.curdom:
+            old = self.curdom
+            self.curdom = snapshot
+            self.curdom_size = bin(snapshot).count("1")
+            if self.observers and not self.is_assigned():
+                self._notify(old & ~snapshot, snapshot & ~old)
 
     #
     #methods for assigning and unassigning
@@ -165,26 +271,79 @@ class Variable:
             return
 
         self.assignedValue = value
+        for c, i in self.scopes:
+            c.n_unasgn -= 1
+            c.unasgn_pos_sum -= i
+        if self.observers:
+            self._notify(self.curdom & ~(1 << self.dom_index[value]), 0)
 
     def unassign(self):
         '''Used by bt_search. Unassign and restore old curdom'''
         if not self.is_assigned():
             print("ERROR: trying to unassign variable", self, " not yet assigned")
             return
+        value = self.assignedValue
         self.assignedValue = None
+        for c, i in self.scopes:
+            c.n_unasgn += 1
+            c.unasgn_pos_sum += i
+        if self.observers:
+            bit = 1 << self.dom_index[value]
+            self._notify(bit & ~self.curdom, self.curdom & ~bit)
 
     def get_assigned_value(self):
         '''return assigned value...returns None if is unassigned'''
         return self.assignedValue
 
+    def add_observer(self, obs, values=True):
+        '''Register obs to be told of changes to the current domain
+           (as returned by cur_domain, so assignments count too):
+           obs.var_changed(var, removed, added) is called with the
+           lists of values that left and entered the current domain.
+           Used to keep search data structures (such as DomainBuckets)
+           up to date incrementally. An observer that only looks at the
+           variable itself (e.g., its domain size) should pass
+           values=False: the lists are then only built if another
+           observer wants them, and are None otherwise.'''
+        if not obs in self.observers:
+            self.observers.append(obs)
+            if values:
+                self.value_observers.append(obs)
+
+    def remove_observer(self, obs):
+        if obs in self.observers:
+            self.observers.remove(obs)
+        if obs in self.value_observers:
+            self.value_observers.remove(obs)
+
     #
     #internal methods
     #
 
+    def _notify(self, removed, added):
+        '''tell the observers that the values whose bits are set in the
+           masks removed and added left and entered the current domain'''
+        if self.value_observers:
+            removed = self._mask_values(removed)
+            added = self._mask_values(added)
+        else:
+            removed = added = None
+        for obs in self.observers:
+            obs.var_changed(self, removed, added)
+
+    def _mask_values(self, mask):
+        '''list of domain values whose bits are set in mask'''
+        vals = []
+        while mask:
+            low = mask & -mask
+            vals.append(self.dom[low.bit_length() - 1])
+            mask ^= low
+        return vals
+
     def value_index(self, value):
         '''Domain values need not be numbers, so return the index
            in the domain list of a variable value'''
-        return self.dom.index(value)
+        return self.dom_index[value]
 
     def __repr__(self):
         return("Var-{}".format(self.name))
@@ -196,7 +355,60 @@ class Variable:
         '''Also print the variable domain and current domain'''
         print("Var--\"{}\": Dom = {}, CurDom = {}".format(self.name, 
                                                              self.dom, 
-                                                             self.curdom))
+                                                             [bool(self.curdom >> i & 1)
+                                                              for i in range(len(self.dom))]))
+class Relation:
+    '''An immutable table of tuples, shared by every constraint that has
+       exactly these tuples (see intern_relation), e.g., all the not-equal
+       constraints between two unconstrained cells of a board.
+
+          tuples      dict whose keys are the tuples (for membership
+                      tests; kept in the order they were given)
+          supports    dict mapping (position, value) to the list of
+                      tuples having value at that position (built on
+                      first use: constraints that filter with their own
+                      representation, e.g. ArrayTableConstraint, never
+                      pay for it)
+
+       Never modify a Relation: build a new one with intern_relation.
+       cache is for representations derived from the tuples (e.g., the
+       arrays of ArrayTableConstraint), shared like the tuples.'''
+
+    def __init__(self, tuples):
+        self.cache = dict()
+        self.tuples = dict.fromkeys(tuples, True)
+        self._supports = None
+
+    @property
+    def supports(self):
+        if self._supports is None:
+            supports = dict()
+            for t in self.tuples:
+                for key in enumerate(t):
+                    if key in supports:
+                        supports[key].append(t)
+                    else:
+                        supports[key] = [t]
+            self._supports = supports
+        return self._supports
+
+    def __len__(self):
+        return len(self.tuples)
+
+#Relations by content, so equal tables are stored once. Entries go away
+#with the last constraint using them.
+_relations = weakref.WeakValueDictionary()
+
+def intern_relation(tuples):
+    '''return the Relation with these tuples (in this order, duplicates
+       dropped), creating it only if no live Relation has them'''
+    key = tuple(dict.fromkeys(tuple(t) for t in tuples))
+    relation = _relations.get(key)
+    if relation is None:
+        relation = Relation(key)
+        _relations[key] = relation
+    return relation
+
 class Constraint: 
     '''Class for defining constraints variable objects specifes an
        ordering over variables.  This ordering is used when calling
@@ -214,34 +426,82 @@ class Constraint:
         in the scope such that this sequence of values satisfies the
         constraints).
 
-        NOTE: This is a very space expensive representation...a proper
-        constraint object would allow for representing the constraint
-        with a function.  
+        NOTE: This is a very space expensive representation...see
+        FunctionConstraint below for constraints represented with a
+        function. Constraints with the same tuples share them (and their
+        support index) through a common Relation.
         '''
 
         self.scope = list(scope)
         self.name = name
-        self.sat_tuples = dict()
-
-        #The next object data item 'sup_tuples' will be used to help
-        #support GAC propgation. It allows access to a list of 
-        #satisfying tuples that contain a particular variable/value
-        #pair.
-        self.sup_tuples = dict()
+        #position of each variable in the scope
+        self.position = dict((var, i) for i, var in enumerate(self.scope))
+
+        #n_unasgn is the number of unassigned variables in the scope and
+        #unasgn_pos_sum the sum of their positions in the scope. Both are
+        #kept up to date by Variable.assign/unassign while the constraint
+        #is attached to its variables (see attach, done by
+        #CSP.add_constraint), and when only one variable is left
+        #unassigned unasgn_pos_sum is its position.
+        self.n_unasgn = 0
+        self.unasgn_pos_sum = 0
+        self.attached = False   #registered with its variables (see attach)
+
+        #The satisfying tuples, held by a shared Relation whose supports
+        #index is used to help support GAC propagation: it gives the
+        #tuples containing a particular value at a particular scope
+        #position. sat_tuples is the relation's tuples (read only).
+        self.relation = intern_relation([])
+        self.sat_tuples = self.relation.tuples
+
+        #conflict weight, bumped by propagators on each domain wipeout
+        #found on this constraint (used by dom/wdeg variable ordering)
+        self.weight = 1
+
+        #global_filter constraints are revised over their whole scope at
+        #once by prop_GAC (see find_unsupported) rather than per variable
+        self.global_filter = False
+
+        #residues[(var, val)] is the last supporting tuple found for
+        #var=val by has_support (a residual support)
+        self.residues = dict()
+
+        #ConstraintStats while the CSP is being profiled (see
+        #CSP.enable_profiling), None otherwise
+        self.stats = None
 
     def add_satisfying_tuples(self, tuples):
         '''We specify the constraint by adding its complete list of satisfying tuples.'''
-        for x in tuples:
-            t = tuple(x)  #ensure we have an immutable tuple
-            if not t in self.sat_tuples:
-                self.sat_tuples[t] = True
-
-            #now put t in as a support for all of the variable values in it
-            for i, val in enumerate(t):
-                var = self.scope[i]
-                if not (var,val) in self.sup_tuples:
-                    self.sup_tuples[(var,val)] = []
-                self.sup_tuples[(var,val)].append(t)
+        if self.sat_tuples:
+            tuples = itertools.chain(self.sat_tuples, tuples)
+        self.set_relation(intern_relation(tuples))
+
+    def set_relation(self, relation):
+        '''Make relation (see intern_relation) the satisfying tuples'''
+        self.relation = relation
+        self.sat_tuples = relation.tuples
+
+    def detach(self):
+        '''Stop being updated by the variables of the scope (used by
+           CSP.remove_constraint): assigning them no longer touches
+           n_unasgn and unasgn_pos_sum'''
+        for i, var in enumerate(self.scope):
+            var.scopes.remove((self, i))
+        self.attached = False
+
+    def attach(self):
+        '''Register with the variables of the scope, counting the
+           unassigned ones (used by CSP.add_constraint: a new constraint
+           starts detached, so building one that is never added to a CSP
+           costs the variables nothing)'''
+        self.n_unasgn = 0
+        self.unasgn_pos_sum = 0
+        for i, var in enumerate(self.scope):
+            var.scopes.append((self, i))
+            if not var.is_assigned():
+                self.n_unasgn += 1
+                self.unasgn_pos_sum += i
+        self.attached = True
 
     def get_scope(self):
         '''get list of variables the constraint is over'''
@@ -258,15 +518,19 @@ class Constraint:
 
     def get_n_unasgn(self):
         '''return the number of unassigned variables in the constraint's scope'''
-        n = 0
-        for v in self.scope:
-            if not v.is_assigned():
-                n = n + 1
-        return n
+        if not self.attached:
+            return sum(1 for v in self.scope if not v.is_assigned())
+        return self.n_unasgn
 
     def get_unasgn_vars(self): 
         '''return list of unassigned variables in constraint's scope. Note
-           more expensive to get the list than to then number'''
+           more expensive to get the list than to then number (except
+           when at most one variable is unassigned)'''
+        if self.attached:
+            if self.n_unasgn == 0:
+                return []
+            if self.n_unasgn == 1:
+                return [self.scope[self.unasgn_pos_sum]]
         vs = []
         for v in self.scope:
             if not v.is_assigned():
@@ -278,23 +542,528 @@ class Constraint:
            of assignments satisfying the constraint where each value is
            still in the corresponding variables current domain
         '''
-        if (var, val) in self.sup_tuples:
-            for t in self.sup_tuples[(var, val)]:
-                if self.tuple_is_valid(t):
-                    return True
+        if self.stats is not None:
+            self.stats.support_calls += 1
+        #AC-3rm: first try the residue, the last support found for
+        #(var, val). A residue needs no restoring on backtrack since
+        #it is only ever a hint that is rechecked before use.
+        t = self.residues.get((var, val))
+        if t is not None and self.tuple_is_valid(t):
+            return True
+        i = self.position.get(var)
+        for t in self.relation.supports.get((i, val), ()):
+            if self.tuple_is_valid(t):
+                self.residues[(var, val)] = t
+                return True
         return False
 
     def tuple_is_valid(self, t):
         '''Internal routine. Check if every value in tuple is still in
            corresponding variable domains'''
+        if self.stats is not None:
+            self.stats.tuples += 1
         for i, var in enumerate(self.scope):
             if not var.in_cur_domain(t[i]):
                 return False
         return True
 
+    def find_unsupported(self, vars=None):
+        '''Return the list of (var, val) pairs, over the unassigned
+           variables in vars (default: the whole scope), such that val
+           is in the current domain of var but has no support in this
+           constraint. Used by prop_GAC; global constraints override it
+           with a dedicated filtering algorithm.'''
+        unsupported = []
+        for var in (self.scope if vars is None else vars):
+            if var.is_assigned():
+                continue
+            for val in var.cur_domain():
+                if not self.has_support(var, val):
+                    unsupported.append((var, val))
+        return unsupported
+
     def __str__(self):
         return("{}({})".format(self.name,[var.name for var in self.scope]))
 
+class ArrayTableConstraint(Constraint):
+    '''Table constraint whose tuples are also kept as a 2-D numpy array
+       of domain indices (one row per scope position, one column per
+       tuple, see Variable.value_index), so find_unsupported can filter
+       all the tuples with a few array operations: each tuple is checked
+       against boolean maps of the current domains, and the values of
+       each variable appearing in a valid tuple are the supported ones.
+       Every value of a valid tuple is supported, so removing the others
+       leaves all valid tuples valid and one pass makes the constraint
+       GAC (it is revised over its whole scope, see global_filter).
+       Requires numpy.'''
+
+    def __init__(self, name, scope):
+        if numpy is None:
+            raise ImportError("ArrayTableConstraint requires numpy")
+        Constraint.__init__(self, name, scope)
+        self.global_filter = True
+        self.set_relation(self.relation)    #index array of the empty relation
+
+    def set_relation(self, relation):
+        Constraint.set_relation(self, relation)
+        #index arrays depend on the domains, and are shared by all
+        #constraints with this relation over the same domains
+        key = ("index_array",) + tuple(tuple(var.dom) for var in self.scope)
+        table = relation.cache.get(key)
+        if table is None:
+            table = self._index_array(relation)
+            relation.cache[key] = table
+        self.table = table
+        #domain sizes the array was built for (see find_unsupported)
+        self.dom_sizes = [len(var.dom) for var in self.scope]
+
+    def _index_array(self, relation):
+        indices = [var.dom_index for var in self.scope]
+        size = max([len(var.dom) for var in self.scope] + [1])
+        #straight from the tuples into the array, with size standing for
+        #a value outside the domain
+        flat = numpy.fromiter((index.get(val, size) for t in relation.tuples
+                               for val, index in zip(t, indices)),
+                              dtype=numpy.min_scalar_type(size),
+                              count=len(relation) * len(indices))
+        table = flat.reshape(len(relation), len(indices)).T
+        #tuples with a value outside a domain can never be valid
+        return numpy.ascontiguousarray(table[:, (table < size).all(axis=0)])
+
+    def _alive(self, var):
+        '''boolean map of the current domain of var, by domain index'''
+        alive = numpy.zeros(len(var.dom), dtype=bool)
+        if var.is_assigned():
+            alive[var.dom_index[var.get_assigned_value()]] = True
+        else:
+            mask = var.curdom
+            while mask:
+                low = mask & -mask
+                alive[low.bit_length() - 1] = True
+                mask ^= low
+        return alive
+
+    def find_unsupported(self, vars=None):
+        scope = self.scope
+        if self.dom_sizes != [len(var.dom) for var in scope]:
+            #values added to a domain (add_domain_values) are not in the
+            #array yet, nor are the tuples using them
+            self.set_relation(self.relation)
+        alive = [self._alive(var) for var in scope]
+        shrink = [not var.is_assigned() and (vars is None or var in vars) for var in scope]
+        table = self.table
+        if self.stats is not None:
+            self.stats.support_calls += sum(var.cur_domain_size() for j, var in enumerate(scope) if shrink[j])
+        valid = alive[0][table[0]]
+        for j in range(1, len(scope)):
+            valid &= alive[j][table[j]]
+        if self.stats is not None:
+            self.stats.tuples += table.shape[1]
+        table = table[:, valid]
+        unsupported = []
+        for j, var in enumerate(scope):
+            if shrink[j]:
+                supported = numpy.zeros(len(alive[j]), dtype=bool)
+                supported[table[j]] = True
+                for i in numpy.flatnonzero(alive[j] & ~supported):
+                    unsupported.append((var, var.dom[i]))
+        return unsupported
+
+class CompactTableConstraint(Constraint):
+    '''Table constraint propagated with Compact-Table. Tuple k of the
+       relation is bit k of a Python int, and masks[i][j] has the bits
+       of the tuples whose value at scope position i is the j-th value
+       of that variable's domain (precomputed, and shared through the
+       relation). current is the bitset of the tuples all of whose
+       values are in the current domains: once added to a CSP the
+       constraint observes its variables (see attach and
+       Variable.add_observer) and clears the masks of
+       values as they leave a domain, saving the previous bitset on a
+       stack. Values coming back on backtracking undo the removals in
+       reverse order, so the saved bitset is simply popped; any other
+       change (e.g. all domains restored at once) recomputes current
+       from the domains. A value is then supported iff its mask meets
+       current, and since pruning unsupported values leaves current
+       unchanged one call of find_unsupported makes the constraint GAC
+       (it is revised over its whole scope, see global_filter).'''
+
+    def __init__(self, name, scope):
+        Constraint.__init__(self, name, scope)
+        self.global_filter = True
+        self.stack = []     #(var, removed values, previous current)
+        self.set_relation(self.relation)    #masks of the empty relation
+
+    def set_relation(self, relation):
+        Constraint.set_relation(self, relation)
+        key = ("bit_masks",) + tuple(tuple(var.dom) for var in self.scope)
+        masks = relation.cache.get(key)
+        if masks is None:
+            #set the bits in bytearrays, then make each one an int
+            #(or-ing in 1 << k would copy a k-bit int for every tuple)
+            size = (len(relation) + 7) // 8
+            bits = [[bytearray(size) for val in var.dom] for var in self.scope]
+            for k, t in enumerate(relation.tuples):
+                byte, bit = k >> 3, 1 << (k & 7)
+                for i, var in enumerate(self.scope):
+                    j = var.dom_index.get(t[i])
+                    if j is not None:
+                        bits[i][j][byte] |= bit
+            masks = [[int.from_bytes(b, "little") for b in row] for row in bits]
+            relation.cache[key] = masks
+        self.masks = masks
+        self.stack = []
+        self.current = self._valid_tuples()
+
+    def detach(self):
+        Constraint.detach(self)
+        for var in self.scope:
+            var.remove_observer(self)
+
+    def attach(self):
+        Constraint.attach(self)
+        for var in self.scope:
+            var.add_observer(self)
+        self.stack = []
+        self.current = self._valid_tuples()
+
+    def _valid_tuples(self):
+        '''bitset of the tuples valid in the current domains'''
+        current = -1
+        for i, var in enumerate(self.scope):
+            masks = self.masks[i]
+            index = var.dom_index
+            allowed = 0
+            for val in var.cur_domain():
+                allowed |= masks[index[val]]
+            current &= allowed
+        return current
+
+    def var_changed(self, var, removed, added):
+        if len(self.masks[self.position[var]]) < len(var.dom):
+            #values added to the domain (add_domain_values) have no mask yet
+            self.set_relation(self.relation)
+            return
+        if added:
+            stack = self.stack
+            if not removed and stack and stack[-1][0] is var and stack[-1][1] == added:
+                self.current = stack.pop()[2]
+            else:
+                self.stack = []
+                self.current = self._valid_tuples()
+            return
+        masks = self.masks[self.position[var]]
+        index = var.dom_index
+        gone = 0
+        for val in removed:
+            gone |= masks[index[val]]
+        self.stack.append((var, removed, self.current))
+        self.current &= ~gone
+
+    def has_support(self, var, val):
+        if not var in self.position or not var.in_cur_domain(val):
+            return False
+        if self.stats is not None:
+            self.stats.support_calls += 1
+        return bool(self.current & self.masks[self.position[var]][var.dom_index[val]])
+
+    def find_unsupported(self, vars=None):
+        current = self.current
+        unsupported = []
+        for i, var in enumerate(self.scope):
+            if var.is_assigned() or (vars is not None and not var in vars):
+                continue
+            masks = self.masks[i]
+            index = var.dom_index
+            if self.stats is not None:
+                self.stats.support_calls += var.cur_domain_size()
+            for val in var.cur_domain():
+                if not current & masks[index[val]]:
+                    unsupported.append((var, val))
+        return unsupported
+
+class FunctionConstraint(Constraint):
+    '''Constraint given intensionally by a check function rather than
+       by a table of satisfying tuples. func is called with one value
+       per variable of the scope (in scope order) and returns True iff
+       those values satisfy the constraint. No tuples are ever stored.'''
+
+    def __init__(self, name, scope, func):
+        Constraint.__init__(self, name, scope)
+        self.func = func
+
+    def add_satisfying_tuples(self, tuples):
+        print("ERROR: trying to add satisfying tuples to function constraint", self)
+
+    def check(self, vals):
+        return bool(self.func(*vals))
+
+    def has_support(self, var, val):
+        '''Generic support test: search the current domains of the
+           other variables for values that together with var=val pass
+           the check function. Subclasses specialise this.'''
+        if not var in self.scope:
+            return False
+        if self.stats is not None:
+            self.stats.support_calls += 1
+        t = self.residues.get((var, val))
+        if t is not None and self.tuple_is_valid(t):
+            return True
+        doms = [[val] if v is var else v.cur_domain() for v in self.scope]
+        for n, t in enumerate(itertools.product(*doms)):
+            if self.func(*t):
+                self.residues[(var, val)] = t
+                if self.stats is not None:
+                    self.stats.tuples += n + 1
+                return True
+        if self.stats is not None:
+            self.stats.tuples += functools.reduce(operator.mul, map(len, doms), 1)
+        return False
+
+class NotEqualConstraint(FunctionConstraint):
+    '''Binary constraint scope[0] != scope[1]'''
+
+    def __init__(self, name, scope):
+        FunctionConstraint.__init__(self, name, scope, operator.ne)
+
+    def has_support(self, var, val):
+        if var is self.scope[0]:
+            other = self.scope[1]
+        elif var is self.scope[1]:
+            other = self.scope[0]
+        else:
+            return False
+        if self.stats is not None:
+            self.stats.support_calls += 1
+            self.stats.tuples += 1
+        n = other.cur_domain_size()
+        return n > 1 or (n == 1 and not other.in_cur_domain(val))
+
+class _OrderConstraint(FunctionConstraint):
+    '''Binary constraint lesser < greater. Propagation only looks at
+       the domain bounds: a value of lesser is supported iff it is
+       below the max of greater, and a value of greater iff it is above
+       the min of lesser. Every wake-up is an O(1) bounds test unless
+       there are values to prune.'''
+
+    def __init__(self, name, scope, func, lesser, greater):
+        FunctionConstraint.__init__(self, name, scope, func)
+        self.lesser = lesser
+        self.greater = greater
+
+    def has_support(self, var, val):
+        if self.stats is not None and var in self.position:
+            self.stats.support_calls += 1
+            self.stats.tuples += 1
+        if var is self.lesser:
+            hi = self.greater.cur_max()
+            return hi is not None and val < hi
+        elif var is self.greater:
+            lo = self.lesser.cur_min()
+            return lo is not None and val > lo
+        return False
+
+    def find_unsupported(self, vars=None):
+        lesser, greater = self.lesser, self.greater
+        lo = lesser.cur_min()
+        hi = greater.cur_max()
+        unsupported = []
+        if lo is None or hi is None:
+            #an empty domain supports nothing
+            return FunctionConstraint.find_unsupported(self, vars)
+        if self.stats is not None:
+            #one bound test decides every value of a variable
+            for var in (lesser, greater):
+                if not var.is_assigned() and (vars is None or var in vars):
+                    self.stats.support_calls += var.cur_domain_size()
+                    self.stats.tuples += 1
+        if (not lesser.is_assigned() and lesser.cur_max() >= hi
+                and (vars is None or lesser in vars)):
+            unsupported.extend((lesser, val) for val in lesser.cur_domain() if val >= hi)
+        if (not greater.is_assigned() and greater.cur_min() <= lo
+                and (vars is None or greater in vars)):
+            unsupported.extend((greater, val) for val in greater.cur_domain() if val <= lo)
+        return unsupported
+
+class LessThanConstraint(_OrderConstraint):
+    '''Binary constraint scope[0] < scope[1]'''
+
+    def __init__(self, name, scope):
+        _OrderConstraint.__init__(self, name, scope, operator.lt, scope[0], scope[1])
+
+class GreaterThanConstraint(_OrderConstraint):
+    '''Binary constraint scope[0] > scope[1]'''
+
+    def __init__(self, name, scope):
+        _OrderConstraint.__init__(self, name, scope, operator.gt, scope[1], scope[0])
+
+def _all_different(*vals):
+    return len(set(vals)) == len(vals)
+
+class AllDifferentConstraint(FunctionConstraint):
+    '''n-ary constraint requiring all variables of the scope to take
+       pairwise different values.
+
+       find_unsupported enforces GAC with Regin's algorithm: compute a
+       maximum matching between variables and values, then a value can
+       be removed from a variable iff the edge is in no maximum
+       matching, i.e., it is not in the matching, its endpoints lie in
+       different strongly connected components of the residual graph,
+       and the value is not reachable from a free value.'''
+
+    def __init__(self, name, scope):
+        FunctionConstraint.__init__(self, name, scope, _all_different)
+        self.global_filter = True
+        #matching from the previous call, used as a warm start
+        self._match = dict()
+
+    def has_support(self, var, val):
+        if not var in self.scope or not var.in_cur_domain(val):
+            return False
+        return not (var, val) in self.find_unsupported([var])
+
+    def _max_matching(self, doms):
+        '''Return a dict mapping each variable index to a value
+           (a maximum matching), reusing the previous matching where
+           it is still valid. doms[i] is the current domain of scope[i]'''
+        var_of = dict()         #value -> matched variable index
+        match = dict()          #variable index -> matched value
+        for i, dom in enumerate(doms):
+            val = self._match.get(self.scope[i])
+            if val is not None and val in dom and not val in var_of:
+                match[i] = val
+                var_of[val] = i
+
+        def augment(i, seen):
+            #iterative search for an augmenting path from variable i
+            stack = [(i, iter(doms[i]))]
+            path = []
+            while stack:
+                j, vals = stack[-1]
+                for val in vals:
+                    if val in seen:
+                        continue
+                    seen.add(val)
+                    k = var_of.get(val)
+                    path.append((j, val))
+                    if k is None:
+                        for x, v in path:
+                            match[x] = v
+                            var_of[v] = x
+                        return True
+                    stack.append((k, iter(doms[k])))
+                    break
+                else:
+                    stack.pop()
+                    if path:
+                        path.pop()
+            return False
+
+        for i in range(len(doms)):
+            if not i in match:
+                if not augment(i, set()):
+                    break
+        self._match = dict((self.scope[i], val) for i, val in match.items())
+        return match
+
+    def find_unsupported(self, vars=None):
+        doms = [v.cur_domain() for v in self.scope]
+        if self.stats is not None:
+            self.stats.support_calls += sum(len(doms[i]) for i, v in enumerate(self.scope)
+                                            if not v.is_assigned() and (vars is None or v in vars))
+            self.stats.tuples += sum(map(len, doms))
+        match = self._max_matching(doms)
+        if len(match) < len(doms):
+            #no complete matching: nothing is supported
+            return [(v, val) for i, v in enumerate(self.scope)
+                    if not v.is_assigned() and (vars is None or v in vars)
+                    for val in doms[i]]
+
+        #residual graph: nodes 0..n-1 are variables, n.. are values.
+        #matched edges go variable -> value, others value -> variable
+        n = len(doms)
+        node_of = dict()
+        for dom in doms:
+            for val in dom:
+                if not val in node_of:
+                    node_of[val] = n + len(node_of)
+        succ = [[] for _ in range(n + len(node_of))]
+        for i, dom in enumerate(doms):
+            for val in dom:
+                if match[i] == val:
+                    succ[i].append(node_of[val])
+                else:
+                    succ[node_of[val]].append(i)
+
+        #values reachable from a free value along alternating paths
+        matched = set(match.values())
+        reach = set(node_of[val] for val in node_of if not val in matched)
+        frontier = list(reach)
+        while frontier:
+            u = frontier.pop()
+            for w in succ[u]:
+                if not w in reach:
+                    reach.add(w)
+                    frontier.append(w)
+
+        scc = _tarjan_scc(succ)
+        unsupported = []
+        for i, var in enumerate(self.scope):
+            if var.is_assigned() or (vars is not None and not var in vars):
+                continue
+            for val in doms[i]:
+                u = node_of[val]
+                if val != match[i] and not u in reach and scc[u] != scc[i]:
+                    unsupported.append((var, val))
+        return unsupported
+
+def _tarjan_scc(succ):
+    '''Return a list giving the strongly connected component id of
+       every node of the graph succ (succ[u] = list of successors of u).
+       Iterative version of Tarjan's algorithm.'''
+    index = [None] * len(succ)
+    low = [0] * len(succ)
+    comp = [None] * len(succ)
+    on_stack = [False] * len(succ)
+    stack = []
+    counter = 0
+    n_comp = 0
+    for root in range(len(succ)):
+        if index[root] is not None:
+            continue
+        work = [(root, 0)]
+        while work:
+            u, k = work.pop()
+            if k == 0:
+                index[u] = low[u] = counter
+                counter += 1
+                stack.append(u)
+                on_stack[u] = True
+            recurse = False
+            while k < len(succ[u]):
+                w = succ[u][k]
+                k += 1
+                if index[w] is None:
+                    work.append((u, k))
+                    work.append((w, 0))
+                    recurse = True
+                    break
+                elif on_stack[w]:
+                    low[u] = min(low[u], index[w])
+            if recurse:
+                continue
+            if low[u] == index[u]:
+                while True:
+                    w = stack.pop()
+                    on_stack[w] = False
+                    comp[w] = n_comp
+                    if w == u:
+                        break
+                n_comp += 1
+            if work:
+                parent = work[-1][0]
+                low[parent] = min(low[parent], low[u])
+    return comp
+
 class CSP:
     '''Class for packing up a set of variables into a CSP problem.
        Contains various utility routines for accessing the problem.
@@ -309,6 +1078,11 @@ class CSP:
         self.vars = []
         self.cons = []
         self.vars_to_cons = dict()
+        self.buckets = None     #DomainBuckets, built on first use
+        self.support_counts = None #SupportCounts, built on first use
+        self.profiler = None    #Profiler, see enable_profiling
+        self.rng = None         #random.Random breaking heuristic ties at random
+                                #(see BT.restart_solve), None for fixed ties
         for v in vars:
             self.add_var(v)
 
@@ -322,11 +1096,15 @@ class CSP:
         else:
             self.vars.append(v)
             self.vars_to_cons[v] = []
+            if self.buckets is not None:
+                self.buckets.add_var(v)
 
     def add_constraint(self,c):
         '''Add constraint to CSP. Note that all variables in the 
-           constraints scope must already have been added to the CSP'''
-        if not type(c) is Constraint:
+           constraints scope must already have been added to the CSP.
+           The constraint is attached to its variables (see
+           Constraint.attach) if it is not already.'''
+        if not isinstance(c, Constraint):
             print("Trying to add non constraint ", c, " to CSP object")
         else:
             for v in c.scope:
@@ -335,6 +1113,27 @@ class CSP:
                     return
                 self.vars_to_cons[v].append(c)
             self.cons.append(c)
+            if not c.attached:
+                c.attach()
+            if self.support_counts is not None:
+                self.support_counts.add_constraint(c)
+            if self.profiler is not None and c.stats is None:
+                c.stats = ConstraintStats()
+
+    def remove_constraint(self, c):
+        '''Remove constraint c from the CSP (e.g., to drop a clue and
+           search again without building a new CSP). c is detached from
+           its variables and from the support counts, so it costs nothing
+           while removed; add_constraint attaches it again.'''
+        if not c in self.cons:
+            print("Trying to remove constraint ", c, " not in CSP object")
+        else:
+            self.cons.remove(c)
+            for v in c.scope:
+                self.vars_to_cons[v].remove(c)
+            if self.support_counts is not None:
+                self.support_counts.remove_constraint(c)
+            c.detach()
 
     def get_all_cons(self):
         '''return list of all constraints in the CSP'''
@@ -352,6 +1151,44 @@ class CSP:
         '''return list of unassigned variables in the CSP'''
         return [v for v in self.vars if not v.is_assigned()]
 
+    def reset_weights(self):
+        '''set the conflict weights of all constraints back to 1'''
+        for c in self.cons:
+            c.weight = 1
+
+    def get_support_counts(self):
+        '''return the SupportCounts of the table constraints of the CSP
+           (building it on the first call); it then stays up to date as
+           values are pruned and restored and variables assigned'''
+        if self.support_counts is None:
+            self.support_counts = SupportCounts(self.cons)
+        return self.support_counts
+
+    def enable_profiling(self):
+        '''Start collecting profiling counters (see Profiler) for the
+           propagator calls made by BT and for each constraint. Returns
+           the Profiler; counters already collected are kept.'''
+        if self.profiler is None:
+            self.profiler = Profiler(self)
+            for c in self.cons:
+                if c.stats is None:
+                    c.stats = ConstraintStats()
+        return self.profiler
+
+    def disable_profiling(self):
+        '''Stop collecting profiling counters and drop them'''
+        self.profiler = None
+        for c in self.cons:
+            c.stats = None
+
+    def get_buckets(self):
+        '''return the DomainBuckets of the unassigned variables of the
+           CSP (building it on the first call); it then stays up to date
+           as values are pruned and restored and variables assigned'''
+        if self.buckets is None:
+            self.buckets = DomainBuckets(self.vars)
+        return self.buckets
+
     def print_all(self):
         print("CSP", self.name)
         print("   Variables = ", self.vars)
@@ -364,10 +1201,290 @@ class CSP:
             print(v, " = ", v.get_assigned_value(), "    ", end='')
         print("")
 
+class DomainBuckets:
+    '''Unassigned variables bucketed by current domain size, for
+       Minimum Remaining Values variable selection without scanning
+       all variables. buckets[k] is a set (a dict) of the unassigned
+       variables with k values in their current domain. The structure
+       observes its variables (see Variable.add_observer), so pruning,
+       unpruning, assigning and unassigning keep it up to date.
+
+       heaps[k] holds the positions of the variables of buckets[k], so
+       the first added variable of a bucket is found without a scan.
+       Entries are not removed when a variable leaves the bucket, but
+       skipped when they come up (and the heap is rebuilt from the
+       bucket once they are the majority).'''
+
+    def __init__(self, vars=[]):
+        self.buckets = []
+        self.heaps = []         #heaps[k]: positions of the variables in buckets[k] (and stale ones)
+        self.size_of = dict()   #var -> bucket it is in (only if unassigned)
+        self.position = dict()  #var -> order in which it was added
+        self.order = []         #position -> var
+        for v in vars:
+            self.add_var(v)
+
+    def add_var(self, var):
+        self.position[var] = len(self.position)
+        self.order.append(var)
+        var.add_observer(self, values=False)
+        self.var_changed(var, None, None)
+
+    def var_changed(self, var, removed, added):
+        n = self.size_of.pop(var, None)
+        if n is not None:
+            del self.buckets[n][var]
+        if not var.is_assigned():
+            n = var.cur_domain_size()
+            while len(self.buckets) <= n:
+                self.buckets.append(dict())
+                self.heaps.append([])
+            bucket, heap = self.buckets[n], self.heaps[n]
+            bucket[var] = True
+            self.size_of[var] = n
+            if len(heap) > 2 * len(bucket) + 8:
+                heap[:] = [self.position[v] for v in bucket]
+                heapq.heapify(heap)
+            else:
+                heapq.heappush(heap, self.position[var])
+
+    def min_var(self, key=None, rng=None):
+        '''return an unassigned variable with the smallest current domain
+           (None if all variables are assigned). Ties are broken by the
+           smallest key(var) if key is given, then by the order in which
+           the variables were added, or at random using rng (a
+           random.Random) if given. Only the smallest non-empty bucket
+           is looked at.'''
+        position = self.position
+        for n, bucket in enumerate(self.buckets):
+            if bucket:
+                if len(bucket) == 1:
+                    return next(iter(bucket))
+                if rng is not None:
+                    ties = list(bucket)
+                    if key is not None:
+                        best = min(key(var) for var in ties)
+                        ties = [var for var in ties if key(var) == best]
+                    return rng.choice(ties)
+                if key is None:
+                    return self._first(n)
+                return min(bucket, key=lambda var: (key(var), position[var]))
+        return None
+
+    def _first(self, n):
+        '''return the first added variable of buckets[n] (not empty)'''
+        heap = self.heaps[n]
+        while True:
+            var = self.order[heap[0]]
+            if self.size_of.get(var) == n:
+                return var
+            heapq.heappop(heap)
+
+class SupportCounts:
+    '''Support counts of the table constraints of a CSP: count[(c, var, val)]
+       is the number of satisfying tuples of c with var=val whose other
+       values are all in their variables' current domains. Instead of
+       recounting, the counts are updated from the relation's supports each
+       time a value leaves or re-enters a current domain (the structure
+       observes the variables, see Variable.add_observer). Constraints
+       without a table (e.g., FunctionConstraint) are not tracked.'''
+
+    def __init__(self, cons=[]):
+        self.count = dict()
+        self.tracked = set()
+        for c in cons:
+            self.add_constraint(c)
+
+    def add_constraint(self, c):
+        if c in self.tracked or not c.sat_tuples:
+            return
+        self.tracked.add(c)
+        for var in c.scope:
+            var.add_observer(self)
+        for t in c.sat_tuples:
+            self._add_tuple(c, t, None, 1)
+
+    def remove_constraint(self, c):
+        if not c in self.tracked:
+            return
+        self.tracked.discard(c)
+        for var in c.scope:
+            for val in var.dom:
+                self.count.pop((c, var, val), None)
+
+    def get(self, c, var, val):
+        return self.count.get((c, var, val), 0)
+
+    def var_changed(self, var, removed, added):
+        for c, i in var.scopes:
+            if not c in self.tracked:
+                continue
+            supports = c.relation.supports
+            for val in removed:
+                for t in supports.get((i, val), ()):
+                    self._add_tuple(c, t, i, -1)
+            for val in added:
+                for t in supports.get((i, val), ()):
+                    self._add_tuple(c, t, i, 1)
+
+    def _add_tuple(self, c, t, skip, delta):
+        '''Add delta to the counts t contributes to, ignoring position
+           skip (the position whose value just changed). t counts towards
+           (c, scope[j], t[j]) iff every position other than j is valid.'''
+        invalid = None
+        for j, var in enumerate(c.scope):
+            if j != skip and not var.in_cur_domain(t[j]):
+                if invalid is not None:
+                    return  #two invalid positions: t counts for nothing
+                invalid = j
+        count = self.count
+        if invalid is not None:
+            key = (c, c.scope[invalid], t[invalid])
+            count[key] = count.get(key, 0) + delta
+        else:
+            for j, var in enumerate(c.scope):
+                if j != skip:
+                    key = (c, var, t[j])
+                    count[key] = count.get(key, 0) + delta
+
+class ConstraintStats:
+    '''Profiling counters of one constraint:
+          revisions      times propagation filtered the constraint
+          support_calls  has_support calls (for constraints with their
+                         own find_unsupported, the values it revised)
+          tuples         tuples scanned (by has_support, or checked by
+                         prop_FC); for intensional and global
+                         constraints, the bound tests and matching
+                         graph edges looked at instead
+          prunings       values the constraint pruned
+          wipeouts       domain wipeouts found on the constraint
+          time           seconds spent filtering the constraint'''
+
+    __slots__ = ("revisions", "support_calls", "tuples", "prunings", "wipeouts", "time")
+
+    def __init__(self):
+        self.revisions = 0
+        self.support_calls = 0
+        self.tuples = 0
+        self.prunings = 0
+        self.wipeouts = 0
+        self.time = 0.0
+
+    def as_dict(self):
+        return dict((name, getattr(self, name)) for name in self.__slots__)
+
+class Profiler:
+    '''Opt-in profiling of constraint propagation (see
+       CSP.enable_profiling). Counters are kept per constraint (the
+       ConstraintStats in each constraint's stats attribute, filled in by
+       the constraints and by prop_FC/prop_GAC) and per propagator (the
+       calls made through BT.propagate: number of calls, prunings,
+       wipeouts and seconds, keyed by the propagator's name). When
+       profiling is off the stats attributes and csp.profiler are None,
+       and every counting site is skipped by a single test.'''
+
+    def __init__(self, csp):
+        self.csp = csp
+        self.propagators = dict()
+
+    def record_call(self, propagator, elapsed, prunings, status):
+        name = getattr(propagator, "__name__", str(propagator))
+        stats = self.propagators.get(name)
+        if stats is None:
+            stats = self.propagators[name] = {"calls": 0, "prunings": 0, "wipeouts": 0, "time": 0.0}
+        stats["calls"] += 1
+        stats["prunings"] += prunings
+        stats["time"] += elapsed
+        if not status:
+            stats["wipeouts"] += 1
+
+    def constraint_stats(self):
+        '''return the list of (constraint, ConstraintStats) pairs'''
+        return [(c, c.stats) for c in self.csp.cons if c.stats is not None]
+
+    def hot_constraints(self, n=10, key="time"):
+        '''return the n (constraint, ConstraintStats) pairs with the
+           largest value of the counter key'''
+        pairs = self.constraint_stats()
+        pairs.sort(key=lambda pair: getattr(pair[1], key), reverse=True)
+        return pairs[:n]
+
+    def reset(self):
+        '''Zero all counters'''
+        self.propagators = dict()
+        for c, stats in self.constraint_stats():
+            c.stats = ConstraintStats()
+
+    def report(self, n=10, key="time"):
+        '''return a printable summary: the propagator counters and the
+           n hottest constraints by key'''
+        lines = ["{:20} {:>9} {:>10} {:>9} {:>10}".format("propagator", "calls", "prunings", "wipeouts", "time")]
+        for name, stats in sorted(self.propagators.items()):
+            lines.append("{:20} {calls:9} {prunings:10} {wipeouts:9} {time:10.4f}".format(name, **stats))
+        lines.append("")
+        lines.append("{:20} {:>9} {:>10} {:>10} {:>9} {:>9} {:>10}".format(
+            "constraint", "revisions", "supports", "tuples", "prunings", "wipeouts", "time"))
+        for c, stats in self.hot_constraints(n, key):
+            lines.append("{:20} {revisions:9} {support_calls:10} {tuples:10} {prunings:9} {wipeouts:9} {time:10.4f}".format(
+                c.name, **stats.as_dict()))
+        return "\n".join(lines)
+
 ########################################################
 # Backtracking Routine                                 #
 ########################################################
 
+#SearchResult statuses
+SOLVED = "solved"
+UNSATISFIABLE = "unsatisfiable"
+NOT_RUN = "not run"
+LIMIT_REACHED = "limit reached"
+
+class SearchResult:
+    '''Outcome of BT.bt_search:
+          status          SOLVED, UNSATISFIABLE, LIMIT_REACHED if the search
+                          was stopped by BT.decision_limit, or NOT_RUN if the
+                          search could not be run (no CSP or no propagator)
+          assignment      dict mapping each variable to its value in the
+                          solution (empty unless solved)
+          decisions       variable assignments made during search
+          prunings        values pruned during search
+          runtime         CPU seconds of the search
+          elapsed         wall clock seconds of the search
+          root_contradiction  True if propagation failed before any
+                          assignment'''
+
+    def __init__(self, status, assignment, decisions, prunings, runtime, elapsed,
+                 root_contradiction=False):
+        self.status = status
+        self.assignment = assignment
+        self.decisions = decisions
+        self.prunings = prunings
+        self.runtime = runtime
+        self.elapsed = elapsed
+        self.root_contradiction = root_contradiction
+
+    @property
+    def solved(self):
+        return self.status == SOLVED
+
+    @property
+    def node_rate(self):
+        '''decisions per second of wall clock time'''
+        return self.decisions / self.elapsed if self.elapsed > 0 else 0.0
+
+    def value(self, var):
+        '''return the value of var in the solution (None if unsolved)'''
+        return self.assignment.get(var)
+
+    def grid(self, var_array):
+        '''return the solution laid out like var_array (a list of lists
+           of variables, e.g., as returned by the futoshiki models)'''
+        return [[self.assignment.get(var) for var in row] for row in var_array]
+
+    def __str__(self):
+        return "{} ({} decisions, {} prunings, {:.4f}s, {:.0f} nodes/s)".format(
+            self.status, self.decisions, self.prunings, self.elapsed, self.node_rate)
+
 class BT:
     '''use a class to encapsulate things like statistics
        and bookeeping for pruning/unpruning variabel domains
@@ -384,9 +1501,17 @@ class BT:
         self.nDecisions = 0 #nDecisions is the number of variable 
                             #assignments made during search
         self.nPrunings  = 0 #nPrunings is the number of value prunings during search
-        unasgn_vars = list() #used to track unassigned variables
+        self.nFails = 0     #nFails is the number of assignments refuted by propagation
+        self.nRestarts = 0  #restarts made by the last restart_solve
+        self.unasgn_vars = dict() #used to track unassigned variables (an ordered set)
+        self.trail = []     #(var, val) prunings made along the current search path
         self.TRACE = False
         self.runtime = 0
+        self.root_contradiction = False
+        self.decision_limit = None #stop the search once nDecisions reaches this
+        self.fail_limit = None     #stop the search once nFails reaches this
+        self.limit_reached = False #True if the last search was stopped by decision_limit
+        self.stack = []     #frames of the search in progress (see bt_solutions)
 
     def trace_on(self):
         '''Turn search trace on'''
@@ -401,6 +1526,7 @@ class BT:
         '''Initialize counters'''
         self.nDecisions = 0
         self.nPrunings = 0
+        self.nFails = 0
         self.runtime = 0
 
     def print_stats(self):
@@ -423,9 +1549,36 @@ class BT:
 
     def restoreUnasgnVar(self, var):
         '''Add variable back to list of unassigned vars'''
-        self.unasgn_vars.append(var)
+        self.unasgn_vars[var] = True
+
+    def undo_trail(self, height):
+        '''Unprune every value pruned since the trail was at height'''
+        trail = self.trail
+        while len(trail) > height:
+            var, val = trail.pop()
+            var.unprune_value(val)
+
+    def propagate(self, propagator, var=None):
+        '''Adapter from the propagator signature to the trail: run the
+           propagator and push the prunings it returns onto the trail,
+           so they are undone by undo_trail. Returns the status.'''
+        profiler = self.csp.profiler
+        if profiler is not None:
+            start = time.perf_counter()
+        status, prunings = propagator(self.csp, var) if var else propagator(self.csp)
+        if profiler is not None:
+            profiler.record_call(propagator, time.perf_counter() - start,
+                                 len(prunings) if prunings else 0, status)
+        if prunings is None:
+            return None
+        self.trail.extend(prunings)
+        self.nPrunings = self.nPrunings + len(prunings)
+        if self.TRACE:
+            print("propagate status = ", status)
+            print("propagate pruned = ", prunings)
+        return status
         
-    def bt_search(self,propagator,var_ord=None,val_ord=None):
+    def bt_search(self,propagator,var_ord=None,val_ord=None,verbose=False):
         '''Try to solve the CSP using specified propagator routine
 
            propagator == a function with the following template
@@ -459,100 +1612,323 @@ class BT:
 
            var_ord is the variable ordering function currently being used; 
            val_ord is the value ordering function currently being used.
+
+           Returns a SearchResult. The solution (if any) is also left
+           assigned to the variables. Nothing is printed unless verbose
+           is true, in which case the outcome, solution and statistics
+           are printed.
            '''
 
+        wall = time.perf_counter()
+        status = self.solve(propagator, var_ord, val_ord)
+        elapsed = time.perf_counter() - wall
+
+        if status is None:
+            return SearchResult(NOT_RUN, dict(), 0, 0, 0, elapsed)
+        assignment = dict()
+        if status == True:
+            outcome = SOLVED
+            for v in self.csp.vars:
+                assignment[v] = v.get_assigned_value()
+        elif self.limit_reached:
+            outcome = LIMIT_REACHED
+        else:
+            outcome = UNSATISFIABLE
+        result = SearchResult(outcome, assignment,
+                              self.nDecisions, self.nPrunings, self.runtime, elapsed,
+                              self.root_contradiction)
+        if not verbose:
+            return result
+
+        if self.root_contradiction:
+            print("CSP{} detected contradiction at root".format(
+                self.csp.name))
+        if self.limit_reached:
+            print("CSP{} unsolved. Decision limit reached".format(self.csp.name))
+        elif status == False:
+            print("CSP{} unsolved. Has no solutions".format(self.csp.name))
+        if status == True:
+            print("CSP {} solved. CPU Time used = {}".format(self.csp.name,
+                                                             self.runtime))
+            self.csp.print_soln()
+
+        print("bt_search finished")
+        self.print_stats()
+        return result
+
+    def solve(self, propagator, var_ord=None, val_ord=None):
+        '''The search done by bt_search, without printing anything.
+           Returns True if a solution was found (it is left assigned to
+           the variables), False if there is none (or if the search was
+           stopped by decision_limit, see limit_reached), and None if the
+           search could not be run. Statistics and runtime (CPU seconds)
+           are left in the BT object.'''
+
+        stime = time.process_time()
+        status = self.start_search(propagator)
+        if status is None:
+            self.runtime = time.process_time() - stime
+            return None
+        if status == True:
+            status = self.bt_iterate(propagator, var_ord, val_ord)   #now do search
+
+        self.undo_trail(0)
+        self.runtime = time.process_time() - stime
+        return status
+
+    def iter_solve(self, propagator, var_ord=None, val_ord=None, limit=None):
+        '''Generator over the solutions of the CSP: yields each solution as
+           a tuple of values, one per variable of the CSP (in the order of
+           csp.get_all_vars()), and only resumes the search when the next
+           one is asked for. Stops after limit solutions if limit is given.
+           When the generator finishes or is closed all variables are
+           unassigned and all domains restored.'''
+
+        stime = time.process_time()
+        try:
+            if limit is not None and limit <= 0:
+                return
+            if self.start_search(propagator) != True:
+                return
+            found = 0
+            for _ in self.bt_solutions(propagator, var_ord, val_ord):
+                found += 1
+                yield tuple(v.get_assigned_value() for v in self.csp.vars)
+                if limit is not None and found >= limit:
+                    return
+        finally:
+            self.runtime = time.process_time() - stime
+            self.restore_all_variable_domains()
+            self.trail = []
+
+    def start_search(self, propagator):
+        '''Reset statistics, domains and the trail, then run the propagator
+           before any assignment. Returns the propagator status (None if the
+           search cannot be run)'''
+
         if self.csp is None or propagator is None:
-            return
+            return None
 
         self.clear_stats()
-        stime = time.process_time()
+        self.root_contradiction = False
+        self.limit_reached = False
 
         self.restore_all_variable_domains()
         
-        self.unasgn_vars = []
+        self.unasgn_vars = dict()
         for v in self.csp.vars:
             if not v.is_assigned():
-                self.unasgn_vars.append(v)
+                self.unasgn_vars[v] = True
+        self.trail = []
 
-        status, prunings = propagator(self.csp) #initial propagate no assigned variables.
+        status = self.propagate(propagator) #initial propagate no assigned variables.
         
-        if prunings is None:
-            return
-
-        self.nPrunings = self.nPrunings + len(prunings)
+        if status is None:
+            return None
 
         if self.TRACE:
             print(len(self.unasgn_vars), " unassigned variables at start of search")
-            print("Root Prunings: ", prunings)
+            print("Root Prunings: ", self.trail)
 
         if status == False:
-            print("CSP{} detected contradiction at root".format(
-                self.csp.name))
-        else:
-            status = self.bt_recurse(propagator, var_ord, val_ord, 1)   #now do recursive search
-
-        self.restoreValues(prunings)
-        if status == False:
-            print("CSP{} unsolved. Has no solutions".format(self.csp.name))
-        if status == True:
-            print("CSP {} solved. CPU Time used = {}".format(self.csp.name,
-                                                             time.process_time() - stime))
-            self.csp.print_soln()
-
-        print("bt_search finished")
-        self.print_stats()
-
-    def bt_recurse(self, propagator, var_ord, val_ord, level):
-        '''Return true if found solution. False if still need to search.
-           If top level returns false--> no solution'''
-
-        if self.TRACE:
-            print('  ' * level, "bt_recurse level ", level)
-           
-        if not self.unasgn_vars:
-            #all variables assigned
+            self.root_contradiction = True
+        return status
+
+    def bt_iterate(self, propagator, var_ord, val_ord):
+        '''Search for the first solution, driven by an explicit stack
+           instead of Python recursion, so there is no recursion limit on
+           the size of the CSP (see bt_solutions).
+           Return true if found solution. False if no solution'''
+        for _ in self.bt_solutions(propagator, var_ord, val_ord):
             return True
-        else:
-            ##Figure out which variable to assign,
-            ##Then remove it from the list of unassigned vars
-            if var_ord:
-              var = var_ord(self.csp)
-            else:
-              var = self.unasgn_vars[0]
-            self.unasgn_vars.remove(var) 
-
-            if self.TRACE:
-                print('  ' * level, "bt_recurse var = ", var)
+        return False
 
-            if val_ord:
-              value_order = val_ord(self.csp,var)
-            else:
-              value_order = var.cur_domain()
+    def bt_solutions(self, propagator, var_ord, val_ord):
+        '''Generator doing the search with an explicit stack. Prunings are
+           kept on self.trail and each stack frame only remembers the trail
+           height to undo back to. Yields (with all the variables assigned)
+           each time a solution is found; resuming the generator
+           backtracks from that solution to look for the next one.
+
+           If decision_limit is set, the search stops (with limit_reached
+           set and the current assignments left in place) when it is about
+           to branch on a new variable after that many decisions; if
+           fail_limit is set, it stops as soon as that many assignments
+           have failed. frontier() then gives the part of the tree it has
+           not explored.'''
+
+        stack = self.stack = [] #frames (var, iterator over values left to try, trail height)
+        descend = True
+        while True:
+            if descend:
+                if not self.unasgn_vars:
+                    #all variables assigned
+                    yield True
+                    if not stack:
+                        return
+                elif ((self.decision_limit is not None and self.nDecisions >= self.decision_limit)
+                      or (self.fail_limit is not None and self.nFails >= self.fail_limit)):
+                    self.limit_reached = True
+                    return
+                else:
+                    ##Figure out which variable to assign,
+                    ##Then remove it from the set of unassigned vars
+                    if var_ord:
+                        var = var_ord(self.csp)
+                    else:
+                        var = next(iter(self.unasgn_vars))
+                    del self.unasgn_vars[var]
+
+                    if self.TRACE:
+                        print('  ' * len(stack), "bt_solutions var = ", var)
+
+                    if val_ord:
+                        value_order = val_ord(self.csp,var)
+                    else:
+                        value_order = var.cur_domain()
+                        if self.csp.rng is not None:
+                            #no value ordering: all the values are tied
+                            self.csp.rng.shuffle(value_order)
+                    stack.append((var, iter(value_order), len(self.trail)))
+
+            var, values, height = stack[-1]
+            if var.is_assigned():
+                #back from a finished subtree: undo the value tried last
+                self.undo_trail(height)
+                var.unassign()
 
-            for val in value_order:
+            descend = False
+            for val in values:
 
                 if self.TRACE:
-                    print('  ' * level, "bt_recurse trying", var, "=", val)
+                    print('  ' * len(stack), "bt_solutions trying", var, "=", val)
 
                 var.assign(val)
                 self.nDecisions = self.nDecisions+1
 
-                status, prunings = propagator(self.csp, var)
-                self.nPrunings = self.nPrunings + len(prunings)
-
-                if self.TRACE:
-                    print('  ' * level, "bt_recurse prop status = ", status)
-                    print('  ' * level, "bt_recurse prop pruned = ", prunings)
-
-                if status:
-                    if self.bt_recurse(propagator, var_ord,val_ord, level+1):
-                        return True
+                if self.propagate(propagator, var):
+                    descend = True
+                    break
 
-                if self.TRACE:
-                    print('  ' * level, "bt_recurse restoring ", prunings)
-                self.restoreValues(prunings)
+                self.nFails = self.nFails+1
+                self.undo_trail(height)
                 var.unassign()
+                if self.fail_limit is not None and self.nFails >= self.fail_limit:
+                    self.limit_reached = True
+                    return
 
-            self.restoreUnasgnVar(var)
-            return False
+            if not descend:
+                stack.pop()
+                self.restoreUnasgnVar(var)
+                if not stack:
+                    return
+
+    def restart_solve(self, propagator, var_ord=None, val_ord=None, schedule=None,
+                      max_restarts=None, seed=None):
+        '''Same as solve, but with restarts: each run of the search is
+           stopped after a number of failed assignments taken from
+           schedule (an iterable of cutoffs: geometric_schedule() by
+           default, or luby_schedule()) and the search starts again from
+           the root. Heuristic ties, and the value order when val_ord is
+           None, are broken at random (csp.rng, a random.Random(seed)
+           unless the CSP already has one) so that each run explores a
+           different tree, while the constraint weights learned by
+           ord_dom_wdeg are kept from run to run.
+
+           After max_restarts restarts (if given) the last run goes on
+           without a cutoff, so the search stays complete.
+
+           Statistics are summed over all runs; nRestarts is the number of
+           restarts made.'''
+
+        if schedule is None:
+            schedule = geometric_schedule()
+        cutoffs = itertools.chain(itertools.islice(schedule, max_restarts), [None])
+        rng, decision_limit = self.csp.rng, self.decision_limit
+        if rng is None:
+            self.csp.rng = random.Random(seed)
+        self.decision_limit = None
+        decisions = prunings = fails = 0
+        self.nRestarts = 0
+        stime = time.process_time()
+        try:
+            for cutoff in cutoffs:
+                self.fail_limit = cutoff
+                status = self.start_search(propagator)
+                if status == True:
+                    status = self.bt_iterate(propagator, var_ord, val_ord)
+                self.undo_trail(0)
+                decisions += self.nDecisions
+                prunings += self.nPrunings
+                fails += self.nFails
+                if status is None or not self.limit_reached:
+                    break
+                self.nRestarts += 1
+        finally:
+            self.fail_limit = None
+            self.decision_limit = decision_limit
+            self.csp.rng = rng
+        self.nDecisions, self.nPrunings, self.nFails = decisions, prunings, fails
+        self.runtime = time.process_time() - stime
+        return status
+
+    def frontier(self):
+        '''After a search stopped by decision_limit or fail_limit, return
+           the subproblems it left unexplored, in the order the search
+           would have visited them. Each is a path: a list of (var, value)
+           assignments to make on top of the assignments in place before
+           the search started. The first path is the node the search
+           stopped at (unless it stopped after a failed value, between two
+           values of a variable); the others are the values not yet tried
+           at each level, deepest first.
+           Together they cover exactly the part of the tree not explored,
+           so searching all of them finds every remaining solution.'''
+        paths = []
+        prefix = []
+        for var, values, height in self.stack:
+            paths.append([prefix + [(var, val)] for val in values])
+            if not var.is_assigned():
+                #stopped by fail_limit: the node itself is not left
+                return [path for level in reversed(paths) for path in level]
+            prefix = prefix + [(var, var.get_assigned_value())]
+        paths.reverse()
+        return [prefix] + [path for level in paths for path in level]
+
+def luby(i):
+    '''return the i-th term (i >= 1) of the Luby sequence
+       1 1 2 1 1 2 4 1 1 2 1 1 2 4 8 ...'''
+    while True:
+        if (i + 1) & i == 0:
+            return (i + 1) >> 1     #i = 2^k - 1: the term is 2^(k-1)
+        i -= (1 << (i.bit_length() - 1)) - 1
+
+def luby_schedule(unit=64):
+    '''Restart cutoffs unit * luby(1), unit * luby(2), ... (see
+       BT.restart_solve)'''
+    for i in itertools.count(1):
+        yield unit * luby(i)
+
+def geometric_schedule(unit=64, factor=1.5):
+    '''Restart cutoffs unit, unit * factor, unit * factor^2, ... (see
+       BT.restart_solve)'''
+    cutoff = unit
+    while True:
+        yield int(cutoff)
+        cutoff *= factor
+
+def iter_solutions(csp, propagator, var_ord=None, limit=None, val_ord=None):
+    '''Generator over the solutions of csp found by backtracking with the
+       given propagator and orderings (see BT.iter_solve). Each solution is
+       a tuple of values, one per variable in csp.get_all_vars() order. The
+       search is resumed lazily and no earlier solution is kept, so this
+       can enumerate more solutions than fit in memory.'''
+    return BT(csp).iter_solve(propagator, var_ord, val_ord, limit)
+
+def count_solutions(csp, propagator, var_ord=None, limit=None):
+    '''Return the number of solutions of csp, counting no further than
+       limit if given (e.g., limit=2 to test for a unique solution)'''
+    n = 0
+    for _ in iter_solutions(csp, propagator, var_ord, limit):
+        n += 1
+    return n
 
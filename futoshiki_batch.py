@@ -0,0 +1,136 @@
+'''Solving many Futoshiki boards at once.
+
+   solve_many(boards, ...) solves a list of boards (in the format read by
+   the futoshiki_csp models) over a pool of worker processes and returns
+   one BoardResult per board, in input order. iter_solve_many does the
+   same but yields the results as they finish.
+
+   For example
+
+       results = solve_many(boards, model=futoshiki_csp_model_2_alldiff,
+                            propagator=prop_GAC, var_ord=ord_mrv, workers=4)
+       for r in results:
+           print(r.index, r.solution, r.decisions, r.cpu_time)
+
+   The model, propagator and ordering functions are sent to the workers by
+   name, so they must be module level functions. Boards are sent in chunks
+   (one message per chunk, with the configuration sent once per chunk) and
+   each solution comes back as a flat tuple of values to keep the
+   inter-process traffic small. Code calling solve_many should sit under
+   an  if __name__ == "__main__":  guard, as for any multiprocessing code.
+'''
+import multiprocessing
+import time
+
+from cspbase import *
+from propagators import *
+from futoshiki_csp import *
+
+
+class BoardResult:
+    '''Outcome of solving one board.
+       index     == position of the board in the input
+       solution  == solved grid as a list of rows of values, None if the
+                    board has no solution
+       decisions == number of variable assignments made by the search
+       prunings  == number of values pruned by the search
+       cpu_time  == CPU seconds spent building the model and searching'''
+
+    __slots__ = ('index', 'solution', 'decisions', 'prunings', 'cpu_time')
+
+    def __init__(self, index, solution, decisions, prunings, cpu_time):
+        self.index = index
+        self.solution = solution
+        self.decisions = decisions
+        self.prunings = prunings
+        self.cpu_time = cpu_time
+
+    def is_solved(self):
+        return self.solution is not None
+
+    def __repr__(self):
+        return "BoardResult({}, solved={}, decisions={}, cpu_time={:.4f})".format(
+            self.index, self.is_solved(), self.decisions, self.cpu_time)
+
+
+def solve_board(board, model=futoshiki_csp_model_1, propagator=prop_GAC,
+                var_ord=ord_mrv, val_ord=None):
+    '''Build the model of one board and search it without printing.
+       Returns (flat tuple of the solution values row by row, or None;
+       decisions; prunings; CPU seconds).'''
+    stime = time.process_time()
+    csp, var_array = model(board)
+    solver = BT(csp)
+    status = solver.solve(propagator, var_ord, val_ord)
+    solution = None
+    if status:
+        solution = tuple(var.get_assigned_value() for row in var_array for var in row)
+    return solution, solver.nDecisions, solver.nPrunings, time.process_time() - stime
+
+
+def solution_grid(flat):
+    '''return the solution values flat (a tuple, row by row, as returned
+       by solve_board) as a list of rows; None stays None'''
+    if flat is None:
+        return None
+    n = int(round(len(flat) ** 0.5))
+    return [list(flat[i*n:(i+1)*n]) for i in range(n)]
+
+
+def _solve_chunk(task):
+    '''Worker entry point: solve a chunk of (index, board) pairs'''
+    config, chunk = task
+    return [(index,) + solve_board(board, *config) for index, board in chunk]
+
+
+def _to_result(payload):
+    index, flat, decisions, prunings, cpu_time = payload
+    return BoardResult(index, solution_grid(flat), decisions, prunings, cpu_time)
+
+
+def _chunks(boards, chunksize):
+    chunk = []
+    for index, board in enumerate(boards):
+        chunk.append((index, board))
+        if len(chunk) == chunksize:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def iter_solve_many(boards, model=futoshiki_csp_model_1, propagator=prop_GAC,
+                    var_ord=ord_mrv, val_ord=None, workers=None, chunksize=None):
+    '''Solve every board of boards and yield a BoardResult for each as soon
+       as its chunk is finished (so not in input order; see
+       BoardResult.index). workers is the number of worker processes
+       (default: one per CPU); with workers=0 the boards are solved in
+       this process one at a time, each result yielded (in input order)
+       before the next board is read. chunksize is the number of boards
+       sent to a worker at a time (default: about four chunks per
+       worker).'''
+    config = (model, propagator, var_ord, val_ord)
+    if workers == 0:
+        for index, board in enumerate(boards):
+            yield _to_result((index,) + solve_board(board, *config))
+        return
+    boards = list(boards)
+    if workers is None:
+        workers = multiprocessing.cpu_count()
+    if chunksize is None:
+        chunksize = max(1, -(-len(boards) // (4 * workers)))
+    tasks = ((config, chunk) for chunk in _chunks(boards, chunksize))
+    with multiprocessing.Pool(workers) as pool:
+        for payloads in pool.imap_unordered(_solve_chunk, tasks):
+            for payload in payloads:
+                yield _to_result(payload)
+
+
+def solve_many(boards, model=futoshiki_csp_model_1, propagator=prop_GAC,
+               var_ord=ord_mrv, val_ord=None, workers=None, chunksize=None):
+    '''Solve every board of boards (see iter_solve_many for the arguments)
+       and return the list of their BoardResults in input order.'''
+    results = list(iter_solve_many(boards, model, propagator, var_ord, val_ord,
+                                   workers, chunksize))
+    results.sort(key=lambda r: r.index)
+    return results
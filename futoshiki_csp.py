@@ -11,7 +11,14 @@ For example, after these three lines of code
     solver.bt_search(prop_FC, var_ord)
 
 var_array[0][0].get_assigned_value() should be the correct value in the top left
-cell of the Futoshiki puzzle.
+cell of the Futoshiki puzzle. bt_search also returns a SearchResult whose
+grid(var_array) method gives the whole solution as a list of lists.
+
+A board is a list of rows. A cell row interleaves the n cell values (0 for
+an empty cell) with the n-1 horizontal clues '<', '>' or '.' between them,
+e.g. [1,'<',0,'.',0]. Optionally a row made up only of clue strings may be
+placed between two cell rows to give the vertical clues between them, one
+per column and read top to bottom, e.g. ['.','>','.'].
 
 1. futoshiki_csp_model_1 (worth 20/100 marks)
     - A model of a Futoshiki grid built using only 
@@ -20,19 +27,56 @@ cell of the Futoshiki puzzle.
 2. futoshiki_csp_model_2 (worth 20/100 marks)
     - A model of a Futoshiki grid built using only n-ary 
       all-different constraints for both the row and column constraints. 
+      futoshiki_csp_model_2(board, table_class=ArrayTableConstraint)
+      keeps the tables as numpy arrays, and with
+      table_class=CompactTableConstraint they are propagated with
+      Compact-Table (see cspbase).
+
+3. futoshiki_csp_model_1_intensional
+    - model 1 with its binary constraints given by check functions
+      (see cspbase.FunctionConstraint) instead of tables of satisfying
+      tuples, so building the model takes no time or memory per tuple.
+
+4. futoshiki_csp_model_2_alldiff
+    - model 2 with each row and column an AllDifferentConstraint
+      (GAC by bipartite matching) and each inequality clue a separate
+      binary constraint; scales to 9x9 boards and beyond.
 
 '''
 from cspbase import *
 import itertools
 
 
-def futoshiki_csp_model_1(futo_grid):
-    n = len(futo_grid) # dimension of the board
-    csp = CSP("model1")
+def _is_clue_row(row):
+    '''A row of futo_grid holding only vertical inequality clues'''
+    return len(row) > 0 and all(isinstance(item, str) for item in row)
+
+
+def _build_variables(futo_grid, csp):
+    '''Create one Variable per cell of futo_grid and add them to csp.
+       Returns the list of lists of Variables and a dict mapping each
+       pair of adjacent cells ((row, col), (row, col+1)) or
+       ((row, col), (row+1, col)) that carries an inequality clue to
+       that clue ('<' or '>', read left to right/top to bottom).
+
+       Rows of futo_grid made up only of strings are vertical clue rows
+       lying between the cell rows above and below them. They hold one
+       entry per column (or 2n-1 entries aligned with the cell rows,
+       in which case the odd positions are ignored).'''
+    n = sum(1 for row in futo_grid if not _is_clue_row(row)) # dimension of the board
     var_array = []
     cond_array = {}
     #Initiailize all Variables since we know their location at all times
-    for row_index, row in enumerate(futo_grid): # we will initialize row-by-row
+    for row in futo_grid: # we will initialize row-by-row
+        row_index = len(var_array)
+        if _is_clue_row(row): # clues between row_index-1 and row_index
+            for col_index, item in enumerate(row):
+                if len(row) != n and col_index % 2 == 1:
+                    continue
+                col = col_index if len(row) == n else col_index // 2
+                if item in [">","<"]:
+                    cond_array[((row_index - 1, col), (row_index, col))] = item
+            continue
         vars_row = []
         for col_index, item in enumerate(row): # going through items in the list thatg breaks down every row
             if col_index % 2 == 0 and item == 0: # no value in futo_grid = full domain of values
@@ -50,103 +94,129 @@ def futoshiki_csp_model_1(futo_grid):
                 cond_array[((row_index, (col_index // 2)), (row_index, ((col_index+2) // 2)))] = item
                 
         var_array.append(vars_row)
-    
-    for index_row in range(len(var_array)):
-        for index_col1, index_col2 in itertools.combinations(range(len(var_array)),2): # go over all rows and cols
-                row_var1 = var_array[index_row][index_col1]
-                row_var2 = var_array[index_row][index_col2]
-                C = Constraint("C_r[{0}][{1}][{2}][{3}]".format(index_row, index_col1, index_row, index_col2), [row_var1, row_var2]) # build a constraint with the given set of 2 vars
-                list_of_values = itertools.product(row_var1.cur_domain(),row_var2.cur_domain()) # produce all possible combinations between 2 domains
-                sat_tuples = [] # satisfying tuples to add to constraint
-                for tup in list_of_values: # Checking conditions in between each value of the tuple (if there is a condition to begin with)
-                    if tup[0] != tup[1]:
-                        if cond_array.get(((index_row, index_col1),(index_row, index_col2)),"") == ">":
-                            if tup[0]>tup[1]:
-                                if tup not in sat_tuples:
-                                        sat_tuples.append(tup)
-                        elif (cond_array.get(((index_row, index_col1),(index_row, index_col2)),"") == "<"):
-                            if tup[0]<tup[1]:
-                                if tup not in sat_tuples:
-                                        sat_tuples.append(tup)
-                        else:
-                            if tup not in sat_tuples:
-                                sat_tuples.append(tup)
-                C.add_satisfying_tuples(sat_tuples)
-                csp.add_constraint(C)
-            # Perform the same routine of checking but for vertical (e.g. columns) constraints
-                col_var1 = var_array[index_col1][index_row]
-                col_var2 = var_array[index_col2][index_row]
-                C = Constraint("C_c[{0}][{1}][{2}][{3}]".format(index_col1, index_row, index_col2, index_row), [col_var1, col_var2])
-                list_of_values = itertools.product(col_var1.cur_domain(),col_var2.cur_domain())
-                sat_tuples = []
-                for tup in list_of_values: # Checking conditions in between each value of the tuple (if there is a condition to begin with)
-                    if tup[0] != tup[1]:
-                        if tup not in sat_tuples:
-                            sat_tuples.append(tup)
-                C.add_satisfying_tuples(sat_tuples)
-                csp.add_constraint(C)
+    return var_array, cond_array
+
+
+def _satisfying_tuples(doms, conds):
+    '''Return the tuples of pairwise different values, the i-th taken
+       from doms[i], that satisfy conds[i] ('<', '>' or None for no
+       clue) between positions i and i+1. The tuples are built position
+       by position, dropping a partial tuple as soon as it repeats a
+       value or breaks a clue, so only satisfying tuples are ever made
+       (in the order itertools.product(*doms) would list them).'''
+    partial = [()]
+    for i, dom in enumerate(doms):
+        cond = conds[i - 1] if i > 0 else None
+        if cond == "<":
+            partial = [t + (val,) for t in partial for val in dom if t[-1] < val and not val in t]
+        elif cond == ">":
+            partial = [t + (val,) for t in partial for val in dom if t[-1] > val and not val in t]
+        else:
+            partial = [t + (val,) for t in partial for val in dom if not val in t]
+    return partial
+
+
+def futoshiki_csp_model_1(futo_grid):
+    csp = CSP("model1")
+    var_array, cond_array = _build_variables(futo_grid, csp)
+
+    n = len(var_array)
+    for index_row in range(n):
+        for index_col1, index_col2 in itertools.combinations(range(n), 2): # go over all rows and cols
+            row_var1 = var_array[index_row][index_col1]
+            row_var2 = var_array[index_row][index_col2]
+            C = Constraint("C_r[{0}][{1}][{2}][{3}]".format(index_row, index_col1, index_row, index_col2), [row_var1, row_var2]) # build a constraint with the given set of 2 vars
+            cond = cond_array.get(((index_row, index_col1), (index_row, index_col2))) # only adjacent cells carry a clue
+            C.add_satisfying_tuples(_satisfying_tuples([row_var1.cur_domain(), row_var2.cur_domain()], [cond]))
+            csp.add_constraint(C)
+            # Perform the same routine but for vertical (e.g. columns) constraints
+            col_var1 = var_array[index_col1][index_row]
+            col_var2 = var_array[index_col2][index_row]
+            C = Constraint("C_c[{0}][{1}][{2}][{3}]".format(index_col1, index_row, index_col2, index_row), [col_var1, col_var2])
+            cond = cond_array.get(((index_col1, index_row), (index_col2, index_row)))
+            C.add_satisfying_tuples(_satisfying_tuples([col_var1.cur_domain(), col_var2.cur_domain()], [cond]))
+            csp.add_constraint(C)
     return csp, var_array
     
 
-def futoshiki_csp_model_2(futo_grid):
-    n = len(futo_grid) # dimension of the board
+def futoshiki_csp_model_2(futo_grid, table_class=Constraint):
+    '''table_class is the class of the row and column table constraints:
+       Constraint, ArrayTableConstraint or CompactTableConstraint'''
     csp = CSP("model2")
-    var_array = []
-    cond_array = {}
-    #Initiailize all Variables since we know their location at all times
-    for row_index, row in enumerate(futo_grid): # we will initialize row-by-row
-        vars_row = []
-        for col_index, item in enumerate(row): # going through items in the list thatg breaks down every row
-            if col_index % 2 == 0 and item == 0: # no value in futo_grid = full domain of values
-                domain = list(range(1, n + 1))
-                successful_var = Variable("V[{0}][{1}]".format(row_index, (col_index // 2)), domain)
-                vars_row.append(successful_var)
-                csp.add_var(successful_var)
-            elif (col_index % 2 == 0 and item != 0): # value provided = this is the domain for this cell 
-                domain = [item]
-                successful_var = Variable("V[{0}][{1}]".format(row_index, (col_index // 2)), domain)
-                successful_var.assign(item)
-                vars_row.append(successful_var)
-                csp.add_var(successful_var)
-            elif col_index % 2 == 1 and item in [">","<"]:
-                cond_array[((row_index, (col_index // 2)), (row_index, ((col_index+2) // 2)))] = item
-                
-        var_array.append(vars_row)
-    
-    for index_row in range(len(var_array)):
-                C = Constraint("C_r[{}]".format(index_row), var_array[index_row])
-                lst = [v.cur_domain() for v in var_array[index_row]]
-                list_of_values = itertools.product(*lst)
-                sat_tuples = [] # satisfying tuples to add to constraint
-                for tup in list_of_values:
-                    if len(tup) != len(set(tup)):
-                        continue
-                    i = 0
-                    while i != len(tup)-1: # Checking conditions in between each value of the tuple (if there is a condition to begin with)
-                        if tup[i] == tup[i+1]:
-                            break
-                        if cond_array.get(((index_row, i),(index_row, i+1)),"") == ">":
-                            if tup[i]<=tup[i+1]:
-                                break
-                        elif (cond_array.get(((index_row, i),(index_row, i+1)),"") == "<"):
-                            if tup[i]>=tup[i+1]:
-                                break
-                        if i == len(tup)-2:
-                            sat_tuples.append(tup)
-                        i += 1
-                C.add_satisfying_tuples(sat_tuples)
-                csp.add_constraint(C)
-            # Perform the same routine of checking but for vertical (e.g. columns) constraints
-                C = Constraint("C_c[{}]".format(index_row), [var_array[j][index_row] for j in range(len(var_array))])
-                lst = [var_array[j][index_row].cur_domain() for j in range(len(var_array))]
-                list_of_values = itertools.product(*lst)
-                sat_tuples = []
-                for tup in list_of_values: # Checking conditions in between each value of the tuple (if there is a condition to begin with)
-                    if len(tup) != len(set(tup)):
-                        continue
-                    if tup not in sat_tuples:
-                        sat_tuples.append(tup)
-                C.add_satisfying_tuples(sat_tuples)
-                csp.add_constraint(C)
+    var_array, cond_array = _build_variables(futo_grid, csp)
+
+    n = len(var_array)
+    for index in range(n):
+        row = var_array[index]
+        C = table_class("C_r[{}]".format(index), row)
+        conds = [cond_array.get(((index, i), (index, i + 1))) for i in range(n - 1)]
+        C.add_satisfying_tuples(_satisfying_tuples([v.cur_domain() for v in row], conds))
+        csp.add_constraint(C)
+        # Perform the same routine but for vertical (e.g. columns) constraints
+        col = [var_array[j][index] for j in range(n)]
+        C = table_class("C_c[{}]".format(index), col)
+        conds = [cond_array.get(((i, index), (i + 1, index))) for i in range(n - 1)]
+        C.add_satisfying_tuples(_satisfying_tuples([v.cur_domain() for v in col], conds))
+        csp.add_constraint(C)
+    return csp, var_array
+
+
+def futoshiki_csp_model_1_intensional(futo_grid):
+    '''Same model as futoshiki_csp_model_1, but every binary constraint
+       is given by a check function (NotEqualConstraint, or a
+       LessThanConstraint/GreaterThanConstraint for a pair carrying an
+       inequality clue, horizontal or vertical) so no satisfying tuples
+       are materialised.'''
+    csp = CSP("model1_intensional")
+    var_array, cond_array = _build_variables(futo_grid, csp)
+
+    n = len(var_array)
+    for index_row in range(n):
+        for index_col1, index_col2 in itertools.combinations(range(n), 2):
+            row_var1 = var_array[index_row][index_col1]
+            row_var2 = var_array[index_row][index_col2]
+            name = "C_r[{0}][{1}][{2}][{3}]".format(index_row, index_col1, index_row, index_col2)
+            cond = cond_array.get(((index_row, index_col1), (index_row, index_col2)), "")
+            if cond == ">":
+                C = GreaterThanConstraint(name, [row_var1, row_var2])
+            elif cond == "<":
+                C = LessThanConstraint(name, [row_var1, row_var2])
+            else:
+                C = NotEqualConstraint(name, [row_var1, row_var2])
+            csp.add_constraint(C)
+
+            col_var1 = var_array[index_col1][index_row]
+            col_var2 = var_array[index_col2][index_row]
+            name = "C_c[{0}][{1}][{2}][{3}]".format(index_col1, index_row, index_col2, index_row)
+            cond = cond_array.get(((index_col1, index_row), (index_col2, index_row)), "")
+            if cond == ">":
+                C = GreaterThanConstraint(name, [col_var1, col_var2])
+            elif cond == "<":
+                C = LessThanConstraint(name, [col_var1, col_var2])
+            else:
+                C = NotEqualConstraint(name, [col_var1, col_var2])
+            csp.add_constraint(C)
+    return csp, var_array
+
+
+def futoshiki_csp_model_2_alldiff(futo_grid):
+    '''Same model as futoshiki_csp_model_2, but each row and column is
+       an AllDifferentConstraint (GAC via bipartite matching, no
+       satisfying tuples) and each inequality clue is its own binary
+       LessThanConstraint/GreaterThanConstraint.'''
+    csp = CSP("model2_alldiff")
+    var_array, cond_array = _build_variables(futo_grid, csp)
+
+    n = len(var_array)
+    for index in range(n):
+        csp.add_constraint(AllDifferentConstraint("C_r[{}]".format(index), var_array[index]))
+        csp.add_constraint(AllDifferentConstraint("C_c[{}]".format(index), [var_array[j][index] for j in range(n)]))
+    for ((row1, col1), (row2, col2)), cond in cond_array.items():
+        name = "C_i[{0}][{1}][{2}][{3}]".format(row1, col1, row2, col2)
+        scope = [var_array[row1][col1], var_array[row2][col2]]
+        if cond == ">":
+            csp.add_constraint(GreaterThanConstraint(name, scope))
+        else:
+            csp.add_constraint(LessThanConstraint(name, scope))
     return csp, var_array
-   
+
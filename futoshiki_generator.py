@@ -0,0 +1,150 @@
+'''Generating Futoshiki puzzles.
+
+   generate_board(n, seed) returns a board in the format read by the
+   futoshiki_csp models (a list of rows interleaving cell values with the
+   '<', '>' and '.' clues) whose solution is unique. generate_many makes
+   several boards over a pool of worker processes.
+
+   A board is made by drawing a random solved grid, starting from every
+   clue of that grid (all cell values and all inequalities between
+   adjacent cells) and removing clues in random order, keeping a removal
+   only if the remaining clues still have a unique solution. Uniqueness is
+   decided by searching for a second solution (search stops at two).
+
+   All the checks for one board share a single CSP: the rows and columns
+   are AllDifferentConstraints and every clue is its own constraint, so
+   removing a clue is just removing its constraint from the CSP, and the
+   variables, matchings, residual supports and dom/wdeg weights carry over
+   from one check to the next instead of rebuilding the model each time.
+'''
+import functools
+import multiprocessing
+import operator
+import random
+
+from cspbase import *
+from propagators import *
+from futoshiki_csp import *
+
+
+def random_solution(n, rng):
+    '''Return a random n x n Latin square (list of rows)'''
+    csp, var_array = futoshiki_csp_model_2_alldiff([[0] + ['.', 0] * (n - 1)] * n)
+    solver = BT(csp)
+    solver.solve(prop_GAC, ord_mrv, lambda csp, var: rng.sample(var.cur_domain(), var.cur_domain_size()))
+    return [[var.get_assigned_value() for var in row] for row in var_array]
+
+
+def render_board(solution, givens, clues, vertical=False):
+    '''Return the board showing the values of solution at the cells in
+       givens and the inequalities between the adjacent cell pairs in
+       clues. With vertical=True a vertical clue row goes between each
+       pair of cell rows.'''
+    n = len(solution)
+    board = []
+    for r in range(n):
+        row = []
+        for c in range(n):
+            row.append(solution[r][c] if (r, c) in givens else 0)
+            if c < n - 1:
+                row.append(_clue_char(solution, (r, c), (r, c + 1)) if ((r, c), (r, c + 1)) in clues else '.')
+        board.append(row)
+        if vertical and r < n - 1:
+            board.append([_clue_char(solution, (r, c), (r + 1, c)) if ((r, c), (r + 1, c)) in clues else '.'
+                          for c in range(n)])
+    return board
+
+
+def _clue_char(solution, a, b):
+    return '<' if solution[a[0]][a[1]] < solution[b[0]][b[1]] else '>'
+
+
+class ClueModel:
+    '''A Futoshiki CSP for a fixed solution where each clue (a given cell
+       (row, col), or a pair of adjacent cells ((row, col), (row', col'))
+       carrying an inequality) is a separate constraint that can be taken
+       out of and put back into the CSP.'''
+
+    def __init__(self, solution, vertical=False):
+        self.solution = solution
+        n = len(solution)
+        self.csp, self.var_array = futoshiki_csp_model_2_alldiff([[0] + ['.', 0] * (n - 1)] * n)
+        self.clue_cons = dict()
+        for r in range(n):
+            for c in range(n):
+                var = self.var_array[r][c]
+                self.clue_cons[(r, c)] = FunctionConstraint("G[{}][{}]".format(r, c), [var],
+                                                            functools.partial(operator.eq, solution[r][c]))
+        for a, b in self.adjacent_pairs(vertical):
+            scope = [self.var_array[a[0]][a[1]], self.var_array[b[0]][b[1]]]
+            name = "C_i[{0}][{1}][{2}][{3}]".format(a[0], a[1], b[0], b[1])
+            if _clue_char(solution, a, b) == '<':
+                self.clue_cons[(a, b)] = LessThanConstraint(name, scope)
+            else:
+                self.clue_cons[(a, b)] = GreaterThanConstraint(name, scope)
+        self.active = set()
+
+    def adjacent_pairs(self, vertical):
+        n = len(self.solution)
+        pairs = [((r, c), (r, c + 1)) for r in range(n) for c in range(n - 1)]
+        if vertical:
+            pairs.extend(((r, c), (r + 1, c)) for r in range(n - 1) for c in range(n))
+        return pairs
+
+    def clues(self):
+        return list(self.clue_cons)
+
+    def set_clue(self, clue, on):
+        if on and not clue in self.active:
+            self.csp.add_constraint(self.clue_cons[clue])
+            self.active.add(clue)
+        elif not on and clue in self.active:
+            self.csp.remove_constraint(self.clue_cons[clue])
+            self.active.discard(clue)
+
+    def is_unique(self, propagator=prop_GAC, var_ord=ord_dom_wdeg):
+        '''True iff the active clues have exactly one solution'''
+        return count_solutions(self.csp, propagator, var_ord, limit=2) == 1
+
+
+def generate_board(n, seed=None, vertical=False):
+    '''Return a random n x n board with a unique solution, from which no
+       clue can be removed without losing uniqueness. Cell values are
+       removed before inequalities. The same seed gives the same board.'''
+    rng = random.Random(seed)
+    solution = random_solution(n, rng)
+    model = ClueModel(solution, vertical)
+    cells = [clue for clue in model.clues() if isinstance(clue[0], int)]
+    pairs = [clue for clue in model.clues() if not isinstance(clue[0], int)]
+    for clue in cells + pairs:
+        model.set_clue(clue, True)
+    rng.shuffle(cells)
+    rng.shuffle(pairs)
+    for clue in cells + pairs:
+        model.set_clue(clue, False)
+        if not model.is_unique():
+            model.set_clue(clue, True)
+    givens = set(clue for clue in model.active if isinstance(clue[0], int))
+    ineqs = set(clue for clue in model.active if not isinstance(clue[0], int))
+    return render_board(solution, givens, ineqs, vertical)
+
+
+def has_unique_solution(board, model=futoshiki_csp_model_2_alldiff, propagator=prop_GAC, var_ord=ord_mrv):
+    '''True iff board has exactly one solution'''
+    csp, var_array = model(board)
+    return count_solutions(csp, propagator, var_ord, limit=2) == 1
+
+
+def _generate_task(args):
+    return generate_board(*args)
+
+
+def generate_many(count, n, seed=0, vertical=False, workers=None):
+    '''Return count boards of size n made by generate_board with seeds
+       seed, seed+1, ... over a pool of workers processes (default: one per
+       CPU; 0 to generate in this process).'''
+    tasks = [(n, seed + i, vertical) for i in range(count)]
+    if workers == 0:
+        return [_generate_task(task) for task in tasks]
+    with multiprocessing.Pool(workers) as pool:
+        return pool.map(_generate_task, tasks, chunksize=1)
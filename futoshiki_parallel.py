@@ -0,0 +1,213 @@
+'''Parallel search of a single Futoshiki board.
+
+   solve_portfolio (futoshiki_portfolio) races different configurations on
+   the same board; parallel_solve(board, ...) instead splits the search
+   tree of one configuration into subproblems and searches them over a
+   pool of worker processes:
+
+       result = parallel_solve(board, propagator=prop_GAC, var_ord=ord_mrv, workers=4)
+       print(result.solution, result.subproblems, result.decisions)
+
+       result = parallel_solve(board, count=True)     #number of solutions
+       print(result.count)
+
+   A subproblem is a path, a list of ((row, col), value) assignments made
+   on top of the board. The tree is first split on the first split_depth
+   variables chosen by var_ord (every value of each, one level at a time).
+   A worker then searches its subproblem for at most split_after decisions;
+   if it is not finished by then it hands back what it has not explored
+   (BT.frontier: the node it stopped at and the values not yet tried
+   above it) as new subproblems, so that long subtrees keep being split
+   while the other workers take the new pieces.
+
+   Each worker builds the model of the board once, when it starts, and
+   rebuilds the state of each subproblem by propagating its assignments
+   from the root. With count=False the workers are terminated as soon as
+   one of them finds a solution; with count=True the solutions found in
+   every subproblem are summed.
+'''
+import itertools
+import multiprocessing
+import os
+import queue
+import time
+from collections import deque
+
+from cspbase import *
+from propagators import *
+from futoshiki_csp import *
+from futoshiki_batch import solution_grid
+
+
+class ParallelResult:
+    '''Outcome of parallel_solve.
+       solution    == a solved grid as a list of rows of values, None if
+                      the board has no solution
+       count       == number of solutions found (at most 1 unless
+                      counting)
+       subproblems == number of subproblems searched
+       decisions   == number of variable assignments made by all workers
+       wall_time   == wall clock seconds of the whole search'''
+
+    __slots__ = ('solution', 'count', 'subproblems', 'decisions', 'wall_time')
+
+    def __init__(self, solution, count, subproblems, decisions, wall_time):
+        self.solution = solution
+        self.count = count
+        self.subproblems = subproblems
+        self.decisions = decisions
+        self.wall_time = wall_time
+
+    def is_solved(self):
+        return self.solution is not None
+
+    def __repr__(self):
+        return "ParallelResult(solved={}, count={}, subproblems={}, decisions={}, wall_time={:.4f})".format(
+            self.is_solved(), self.count, self.subproblems, self.decisions, self.wall_time)
+
+
+POLL_INTERVAL = 0.5     #seconds between checks for workers that died while searching
+
+_worker = None      #(solver, var_array, cells, propagator, var_ord, val_ord) of this process
+_started = None     #queue on which this process reports (task id, pid) as it takes a task
+
+
+def _init_worker(board, model, propagator, var_ord, val_ord, started=None):
+    '''Worker initializer: build the model of board once per process'''
+    global _worker, _started
+    _started = started
+    csp, var_array = model(board)
+    cells = dict()
+    for r, row in enumerate(var_array):
+        for c, var in enumerate(row):
+            cells[var] = (r, c)
+    _worker = (BT(csp), var_array, cells, propagator, var_ord, val_ord)
+
+
+def _replay(solver, var_array, path, propagator):
+    '''Make the assignments of path, propagating after each. Returns False
+       if one of them is inconsistent.'''
+    for (r, c), val in path:
+        var = var_array[r][c]
+        if not var.in_cur_domain(val):
+            return False
+        var.assign(val)
+        del solver.unasgn_vars[var]
+        if not solver.propagate(propagator, var):
+            return False
+    return True
+
+
+def _search(task):
+    '''Worker entry point: search the subproblem path for at most limit
+       decisions. Returns (task id, number of solutions found, the first
+       of them as a flat tuple of values or None, decisions, unexplored
+       subproblems). Unless counting, the search stops at the first
+       solution.'''
+    task_id, path, limit, count = task
+    if _started is not None:
+        _started.put((task_id, os.getpid()))
+    solver, var_array, cells, propagator, var_ord, val_ord = _worker
+    found, first, frontier = 0, None, []
+    if solver.start_search(propagator) and _replay(solver, var_array, path, propagator):
+        solver.decision_limit = limit
+        search = solver.bt_solutions(propagator, var_ord, val_ord)
+        for _ in search:
+            found += 1
+            if first is None:
+                first = tuple(var.get_assigned_value() for row in var_array for var in row)
+            if not count:
+                break
+        search.close()
+        if solver.limit_reached:
+            frontier = [path + [(cells[var], val) for var, val in rest] for rest in solver.frontier()]
+    return task_id, found, first, solver.nDecisions, frontier
+
+
+def parallel_solve(board, model=futoshiki_csp_model_2_alldiff, propagator=prop_GAC,
+                   var_ord=ord_mrv, val_ord=None, workers=None, split_depth=2,
+                   split_after=1000, count=False):
+    '''Search board by splitting its search tree over worker processes
+       (see the module docstring) and return a ParallelResult. workers is
+       the number of worker processes (default: one per CPU); with
+       workers=0 the subproblems are searched one after the other in this
+       process. split_depth is the number of variables the tree is first
+       split on and split_after the number of decisions after which a
+       subproblem is split again. With count=True all the solutions are
+       counted instead of stopping at the first one.
+
+       Raises RuntimeError if a worker process dies (e.g. killed when out
+       of memory) while searching a subproblem, since the result would
+       then miss that part of the tree.'''
+    start = time.perf_counter()
+    config = (board, model, propagator, var_ord, val_ord)
+    result = ParallelResult(None, 0, 0, 0, 0.0)
+    task_ids = itertools.count()
+
+    def task(path):
+        return (next(task_ids), path, 1 if len(path) < split_depth else split_after, count)
+
+    def merge(payload):
+        '''Add payload (as returned by _search) to the result; returns the
+           new subproblems to search, or None when the search is over'''
+        task_id, found, first, decisions, frontier = payload
+        result.subproblems += 1
+        result.decisions += decisions
+        result.count += found
+        if result.solution is None:
+            result.solution = solution_grid(first)
+        if found and not count:
+            return None
+        return frontier
+
+    if workers == 0:
+        _init_worker(*config)
+        tasks = deque([task([])])
+        while tasks:
+            frontier = merge(_search(tasks.popleft()))
+            if frontier is None:
+                break
+            tasks.extend(task(path) for path in frontier)
+    else:
+        if workers is None:
+            workers = multiprocessing.cpu_count()
+        answers = queue.Queue()
+        started = multiprocessing.SimpleQueue()    #written at once, not by a feeder thread
+        running = dict()    #task id -> pid of the worker searching it
+        done = set()
+        with multiprocessing.Pool(workers, _init_worker, config + (started,)) as pool:
+            def submit(path):
+                pool.apply_async(_search, (task(path),), callback=answers.put,
+                                 error_callback=answers.put)
+            submit([])
+            pending = 1
+            while pending:
+                #the pool never answers for a task whose worker died, so
+                #look for tasks still running on a worker that has exited
+                #(before the wait: an answer sent before exiting arrives)
+                while not started.empty():
+                    task_id, pid = started.get()
+                    if not task_id in done:
+                        running[task_id] = pid
+                alive = set(proc.pid for proc in multiprocessing.active_children())
+                lost = [task_id for task_id, pid in running.items() if not pid in alive]
+                try:
+                    payload = answers.get(timeout=POLL_INTERVAL)
+                except queue.Empty:
+                    if lost:
+                        raise RuntimeError("a worker process died while searching a subproblem")
+                    continue
+                pending -= 1
+                if isinstance(payload, BaseException):
+                    raise payload
+                done.add(payload[0])
+                running.pop(payload[0], None)
+                frontier = merge(payload)
+                if frontier is None:
+                    break       #leaving the with block terminates the workers
+                for path in frontier:
+                    submit(path)
+                pending += len(frontier)
+        started.close()
+    result.wall_time = time.perf_counter() - start
+    return result
@@ -0,0 +1,174 @@
+'''Portfolio solving of a single Futoshiki board.
+
+   Which model, propagator and ordering is fastest varies a lot from board
+   to board. solve_portfolio(board) runs several configurations at once,
+   each in its own worker process, returns the first answer (a solution,
+   or the proof that there is none) and terminates the other workers.
+
+   A configuration is a tuple (name, model, propagator, var_ord, val_ord);
+   PORTFOLIO is the default list. The name of the configuration that
+   answered first is recorded in a PortfolioStats object, which can be
+   saved to and loaded from a JSON file and ranks the configurations by
+   their wins, so that with fewer workers than configurations the ones
+   that won most often so far are run:
+
+       stats = load_stats("portfolio.json")
+       result = solve_portfolio(board, workers=2, stats=stats)
+       print(result.winner, result.solution)
+       stats.save("portfolio.json")
+'''
+import functools
+import json
+import multiprocessing
+import os
+import queue
+import time
+
+from cspbase import *
+from propagators import *
+from futoshiki_csp import *
+from futoshiki_batch import solve_board, solution_grid
+
+
+# Best first: with fewer workers than configurations (and no stats) the
+# first ones are run.
+PORTFOLIO = [
+    ("model_2_alldiff/prop_GAC/ord_dom_wdeg", futoshiki_csp_model_2_alldiff, prop_GAC, ord_dom_wdeg, None),
+    ("model_2_ct/prop_GAC/ord_mrv",
+     functools.partial(futoshiki_csp_model_2, table_class=CompactTableConstraint), prop_GAC, ord_mrv, None),
+    ("model_1/prop_GAC/ord_mrv", futoshiki_csp_model_1, prop_GAC, ord_mrv, None),
+    ("model_1_intensional/prop_FC/ord_mrv", futoshiki_csp_model_1_intensional, prop_FC, ord_mrv, None),
+    ("model_1/prop_FC/ord_dom_wdeg", futoshiki_csp_model_1, prop_FC, ord_dom_wdeg, None),
+    ("model_1/prop_FC/static", futoshiki_csp_model_1, prop_FC, None, None),
+]
+
+POLL_INTERVAL = 0.5     #seconds between checks for workers that died without answering
+
+
+class PortfolioResult:
+    '''Outcome of solve_portfolio.
+       winner    == name of the configuration that answered first (None if
+                    none did, e.g. on timeout)
+       solution  == solved grid as a list of rows of values, None if the
+                    board has no solution or there was no answer
+       decisions == number of variable assignments made by the winner
+       prunings  == number of values pruned by the winner
+       cpu_time  == CPU seconds the winner spent building and searching
+       wall_time == wall clock seconds until the answer'''
+
+    __slots__ = ('winner', 'solution', 'decisions', 'prunings', 'cpu_time', 'wall_time')
+
+    def __init__(self, winner, solution, decisions, prunings, cpu_time, wall_time):
+        self.winner = winner
+        self.solution = solution
+        self.decisions = decisions
+        self.prunings = prunings
+        self.cpu_time = cpu_time
+        self.wall_time = wall_time
+
+    def is_solved(self):
+        return self.solution is not None
+
+    def __repr__(self):
+        return "PortfolioResult(winner={}, solved={}, wall_time={:.4f})".format(
+            self.winner, self.is_solved(), self.wall_time)
+
+
+class PortfolioStats:
+    '''Number of boards each configuration (by name) answered first'''
+
+    def __init__(self, wins=None):
+        self.wins = dict(wins or {})
+
+    def record(self, name):
+        self.wins[name] = self.wins.get(name, 0) + 1
+
+    def ranked(self, configs):
+        '''return configs ordered by decreasing number of wins (ties keep
+           their order in configs)'''
+        return sorted(configs, key=lambda config: -self.wins.get(config[0], 0))
+
+    def save(self, path):
+        with open(path, "w") as f:
+            json.dump({"wins": self.wins}, f, indent=1, sort_keys=True)
+
+
+def load_stats(path):
+    '''return the PortfolioStats saved in path (empty if there is no file)'''
+    if not os.path.exists(path):
+        return PortfolioStats()
+    with open(path) as f:
+        return PortfolioStats(json.load(f)["wins"])
+
+
+def _run_config(answers, config, board):
+    '''Worker entry point: solve board with one configuration and put
+       (name, payload) on the answers queue, payload being what
+       solve_board returns, or None if the configuration failed.'''
+    name = config[0]
+    try:
+        answers.put((name, solve_board(board, *config[1:])))
+    except Exception:
+        answers.put((name, None))
+
+
+def solve_portfolio(board, configs=None, workers=None, timeout=None, stats=None):
+    '''Solve board with the configurations configs (default: PORTFOLIO)
+       racing in parallel processes and return a PortfolioResult for the
+       first one to answer; the other processes are then terminated.
+
+       At most workers configurations are run (default: one per CPU, as
+       more processes than CPUs only slow the winner down): the first
+       ones of configs, in the order of their wins if stats is given.
+       timeout is in seconds; if no configuration answers in time
+       the result has no winner. If stats is given the winner's win is
+       recorded in it.'''
+    configs = list(PORTFOLIO if configs is None else configs)
+    if stats is not None:
+        configs = stats.ranked(configs)
+    if workers is None:
+        workers = multiprocessing.cpu_count()
+    configs = configs[:workers]
+
+    start = time.perf_counter()
+    answers = multiprocessing.Queue()
+    procs = [multiprocessing.Process(target=_run_config, args=(answers, config, board), daemon=True)
+             for config in configs]
+    for proc in procs:
+        proc.start()
+
+    result = PortfolioResult(None, None, 0, 0, 0.0, 0.0)
+    waiting = dict((config[0], proc) for config, proc in zip(configs, procs))
+    try:
+        while waiting:
+            wait = POLL_INTERVAL
+            if timeout is not None:
+                wait = min(wait, timeout - (time.perf_counter() - start))
+                if wait <= 0:
+                    break
+            #a worker flushes its answer before exiting, so one that had
+            #exited before an empty wait was killed (e.g. out of memory)
+            dead = [name for name, proc in waiting.items() if proc.exitcode is not None]
+            try:
+                name, payload = answers.get(timeout=wait)
+            except queue.Empty:
+                for name in dead:
+                    del waiting[name]
+                continue
+            del waiting[name]
+            if payload is None:
+                continue    #that configuration failed, wait for another
+            flat, decisions, prunings, cpu_time = payload
+            result = PortfolioResult(name, solution_grid(flat), decisions, prunings, cpu_time, 0.0)
+            if stats is not None:
+                stats.record(name)
+            break
+    finally:
+        for proc in procs:
+            if proc.is_alive():
+                proc.terminate()
+        for proc in procs:
+            proc.join()
+        answers.close()
+    result.wall_time = time.perf_counter() - start
+    return result
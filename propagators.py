@@ -70,8 +70,18 @@ var_ordering == a function with the following template
 
     var_ordering returns the next Variable to be assigned, as per the definition
     of the heuristic it implements.
+
+val_ordering == a function with the following template
+    val_ordering(csp, var)
+        ==> returns list of values
+
+    val_ordering returns the values of var's current domain in the order
+    bt_search should try them.
    '''
 
+import time
+from collections import deque
+
 def prop_BT(csp, newVar=None):
     '''Do plain backtracking propagation. That is, do no 
     propagation at all. Just check fully instantiated constraints'''
@@ -102,6 +112,10 @@ def prop_FC(csp, newVar=None):
                 continue
         else: # the case where the number of unassigned variables in the constraint's scope == 1        
             var = C.get_unasgn_vars()[0]
+            stats = C.stats # profiling counters, None unless profiling
+            if stats is not None:
+                start = time.perf_counter()
+                size = var.cur_domain_size()
             for value in var.cur_domain():
                 values_for_check = []
                 for check_var in C.get_scope(): #re-assemble the list of values in the same order as variables are for the check method
@@ -112,41 +126,134 @@ def prop_FC(csp, newVar=None):
                 if C.check(values_for_check) == False: # constraints fails => prune the value 
                     var.prune_value(value)
                     pruned.append((var, value))
+            if stats is not None:
+                stats.revisions += 1
+                stats.tuples += size
+                stats.prunings += size - var.cur_domain_size()
+                stats.time += time.perf_counter() - start
             if var.cur_domain_size() == 0: # DWO/dead-end condition
+                C.weight += 1 # conflict weight for ord_dom_wdeg
+                if stats is not None:
+                    stats.wipeouts += 1
                 return (False, pruned)
     return (True, pruned) 
 
+def _enqueue_arcs(queue, queued, C, skip=None):
+    '''Put the arcs of constraint C on the GAC queue, except those already
+       on it. An arc is a (constraint, variable) pair whose variable's
+       values are to be revised; global constraints (see
+       Constraint.global_filter) are revised over their whole scope at once
+       and so get a single (constraint, None) arc. skip is the variable
+       whose domain just changed: its own arc does not need revising.'''
+    if C.global_filter:
+        arcs = [(C, None)]
+    else:
+        arcs = [(C, var) for var in C.scope if var is not skip]
+    for arc in arcs:
+        if not arc in queued:
+            queued.add(arc)
+            queue.append(arc)
+
 def prop_GAC(csp, newVar=None):
     '''Do GAC propagation. If newVar is None we do initial GAC enforce 
        processing all constraints. Otherwise we do GAC enforce with
-       constraints containing newVar on GAC Queue'''
+       constraints containing newVar on GAC Queue.
+
+       This is AC-3 over (constraint, variable) arcs: the queue is a deque
+       with a membership set so that each arc is on it at most once, and
+       when a variable loses values only the arcs of the other variables
+       of its constraints are put back on the queue.'''
     pruned = []
-    filtered_cons = []
+    queue = deque()
+    queued = set()
     if not newVar: # no newVar given by the user
-        constraints = csp.get_all_cons()
+        for C in csp.get_all_cons():
+            _enqueue_arcs(queue, queued, C)
     else: # newVar given by the user
-        constraints = csp.get_cons_with_var(newVar)
-    while len(constraints) != 0: # while the queue is not empty
-        C = constraints.pop(0) 
-        if C.get_n_unasgn() == 0: # return # of unassigned variables in this particular C. If it's completely assigned - skip unneccesary work
-                continue
+        for C in csp.get_cons_with_var(newVar):
+            _enqueue_arcs(queue, queued, C, newVar)
+    while queue: # while the queue is not empty
+        arc = queue.popleft()
+        queued.discard(arc)
+        C, var = arc
+        if C.get_n_unasgn() == 0: # If it's completely assigned - skip unneccesary work
+            continue
+        if var is not None and var.is_assigned():
+            continue
+        stats = C.stats # profiling counters, None unless profiling
+        if stats is not None:
+            start = time.perf_counter()
+        if var is None:
+            unsupported = C.find_unsupported()
         else:
-            for var in C.get_scope(): # find all vars this contraints covers
-                for value in var.cur_domain(): # find all values available to iterate over in the unassigned var
-                    if C.has_support(var, value) == False: # perform the check
-                        var.prune_value(value)
-                        pruned.append((var, value))
-                        constraints.extend(csp.get_cons_with_var(var))
-                if var.cur_domain_size() == 0: # DWO/dead-end condition
-                    return (False, pruned)
+            unsupported = C.find_unsupported([var])
+        if stats is not None:
+            stats.revisions += 1
+            stats.prunings += len(unsupported)
+            stats.time += time.perf_counter() - start
+        changed = []
+        for var, value in unsupported: # (var, value) pairs without support
+            var.prune_value(value)
+            pruned.append((var, value))
+            if not var in changed:
+                changed.append(var)
+        for var in changed:
+            if var.cur_domain_size() == 0: # DWO/dead-end condition
+                C.weight += 1 # conflict weight for ord_dom_wdeg
+                if stats is not None:
+                    stats.wipeouts += 1
+                return (False, pruned)
+            for C2 in csp.get_cons_with_var(var):
+                if C2 is C and (C.global_filter or len(C.scope) == 2):
+                    continue # C is already at its fixpoint
+                _enqueue_arcs(queue, queued, C2, var)
     return (True, pruned)
 
 def ord_mrv(csp):
-    ''' return variable according to the Minimum Remaining Values heuristic '''
-    min = (None, float('inf'))
-    for var in csp.get_all_unasgn_vars(): # pull all unassigned vars
-        if var.cur_domain_size() < min[1]: # pull all available values for each var to tail up the count
-            min = (var, var.cur_domain_size()) 
-    return min[0]
-
-	
\ No newline at end of file
+    ''' return variable according to the Minimum Remaining Values heuristic
+        (ties broken at random if csp.rng is set) '''
+    return csp.get_buckets().min_var(rng=csp.rng)
+
+def ord_mrv_degree(csp):
+    ''' return variable according to the Minimum Remaining Values heuristic,
+        breaking ties by the largest degree (number of constraints on the variable),
+        then at random if csp.rng is set '''
+    return csp.get_buckets().min_var(key=lambda var: -len(csp.vars_to_cons[var]), rng=csp.rng)
+
+def ord_dom_wdeg(csp):
+    ''' return variable according to the dom/wdeg heuristic: the smallest ratio
+        of current domain size to weighted degree, where the weighted degree of
+        a variable is the sum of the weights of its constraints that still have
+        another unassigned variable. Constraint weights count the domain wipeouts
+        prop_FC/prop_GAC have found on each constraint; they are kept between
+        searches (see CSP.reset_weights) so later runs learn from earlier ones.
+        Ties are broken at random if csp.rng is set. '''
+    best = (None, float('inf'))
+    ties = 0
+    for var in csp.get_all_unasgn_vars():
+        wdeg = 0
+        for C in csp.vars_to_cons[var]:
+            if C.get_n_unasgn() > 1:
+                wdeg += C.weight
+        ratio = var.cur_domain_size() / wdeg if wdeg else float('inf')
+        if ratio < best[1] or best[0] is None:
+            best = (var, ratio)
+            ties = 1
+        elif ratio == best[1] and csp.rng is not None:
+            ties += 1 # keep each of the tied variables with equal probability
+            if csp.rng.randrange(ties) == 0:
+                best = (var, ratio)
+    return best[0]
+
+def val_lcv(csp, var):
+    ''' return the values of var's current domain ordered by the Least
+        Constraining Value heuristic: values with the most supporting tuples
+        left in var's (table) constraints come first. Support counts come
+        from csp.get_support_counts() and are maintained incrementally.
+        Ties are broken at random if csp.rng is set. '''
+    counts = csp.get_support_counts()
+    cons = [C for C in csp.vars_to_cons[var] if C in counts.tracked]
+    values = var.cur_domain()
+    if csp.rng is not None:
+        csp.rng.shuffle(values) # sorted is stable: shuffled ties stay shuffled
+    return sorted(values, key=lambda val: -sum(counts.get(C, var, val) for C in cons))